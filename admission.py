@@ -0,0 +1,179 @@
+# admission.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Tuple
+
+# =====================================================
+# ADMISSÃO + FILA JUSTA POR CONTA (estágio do LLM)
+# =====================================================
+# Só ADMISSION_MAX_CONCURRENT chamadas ao LLM rodam ao mesmo tempo.
+# As demais esperam numa fila limitada, servida por Deficit Round-Robin
+# entre contas: uma conta spammando não passa na frente das outras.
+# Acima dos limites a request é recusada na hora (429 por conta,
+# 503 fila cheia/espera longa) ou rebaixada para o plano por regras.
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_PER_ACCOUNT = int(os.getenv("ADMISSION_MAX_PER_ACCOUNT", "4"))  # rodando + esperando
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))  # segundos na fila
+ADMISSION_OVERLOAD = os.getenv("ADMISSION_OVERLOAD", "downgrade")  # "downgrade" | "reject"
+# Pesos por conta: "contaA:2,contaB:0.5" (padrão 1)
+ADMISSION_WEIGHTS = {
+    k.strip(): float(v)
+    for k, v in (item.split(":", 1) for item in os.getenv("ADMISSION_WEIGHTS", "").split(",") if ":" in item)
+}
+# Peso <= 0 nunca acumula déficit e o rodízio não sai do lugar
+ADMISSION_MIN_WEIGHT = 0.01
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(reason)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_per_account: int = ADMISSION_MAX_PER_ACCOUNT, max_wait: float = ADMISSION_MAX_WAIT,
+                 weights: Dict[str, float] = ADMISSION_WEIGHTS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_account = max_per_account
+        self.max_wait = max_wait
+        self.weights: Dict[str, float] = {}
+        for account, weight in weights.items():
+            if not weight >= ADMISSION_MIN_WEIGHT:  # também pega NaN
+                print(f"⚠️  Admission weight {weight} for {account} raised to {ADMISSION_MIN_WEIGHT}")
+                weight = ADMISSION_MIN_WEIGHT
+            self.weights[account] = weight
+
+        self._running = 0
+        self._queued = 0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {}
+        self._rr: Deque[str] = deque()  # contas com gente esperando, em ordem de rodízio
+        self._deficit: Dict[str, float] = {}
+        self._per_account: Dict[str, int] = {}
+
+        self._service_s = 5.0  # média móvel do tempo de uma chamada
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._counters = {"admitted": 0, "rejected": 0, "timedOut": 0}
+
+    # ---------------- estimativas / stats ----------------
+
+    def _retry_after(self) -> float:
+        return self._service_s * (self._queued + 1) / max(1, self.max_concurrent)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "queuedByAccount": {a: len(q) for a, q in self._queues.items() if q},
+            "waitMs": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+            "serviceMs": round(self._service_s * 1000, 1),
+            **self._counters,
+        }
+
+    # ---------------- DRR ----------------
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrent and self._rr:
+            account = self._rr[0]
+            q = self._queues[account]
+            while q and q[0][0].done():  # desistiu (timeout/cancelado)
+                q.popleft()
+            if not q:
+                self._rr.popleft()
+                self._queues.pop(account, None)
+                self._deficit.pop(account, None)
+                continue
+            if self._deficit[account] >= 1:
+                self._deficit[account] -= 1
+                fut, _ = q.popleft()
+                self._queued -= 1
+                self._running += 1
+                fut.set_result(None)
+            else:
+                self._deficit[account] += self.weights.get(account, 1.0)
+                self._rr.rotate(-1)
+
+    # ---------------- API ----------------
+
+    async def acquire(self, account: str) -> None:
+        if self._per_account.get(account, 0) >= self.max_per_account:
+            self._counters["rejected"] += 1
+            raise AdmissionRejected(429, f"Too many concurrent analyses for account {account}", self._retry_after())
+        if self._running < self.max_concurrent and not self._rr:
+            self._running += 1
+            self._per_account[account] = self._per_account.get(account, 0) + 1
+            self._waits.append(0.0)
+            self._counters["admitted"] += 1
+            return
+        if self._queued >= self.max_queue:
+            self._counters["rejected"] += 1
+            raise AdmissionRejected(503, "Analysis queue is full", self._retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        t = time.monotonic()
+        q = self._queues.setdefault(account, deque())
+        if account not in self._rr:
+            self._rr.append(account)
+            self._deficit.setdefault(account, 0.0)
+        q.append((fut, t))
+        self._queued += 1
+        self._per_account[account] = self._per_account.get(account, 0) + 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(fut, self.max_wait)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # o slot chegou junto com o cancelamento: devolve
+                self.release(account)
+            else:
+                self._queued -= 1
+                self._leave(account)
+                try:
+                    q.remove((fut, t))
+                except ValueError:
+                    pass
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self._counters["timedOut"] += 1
+                raise AdmissionRejected(503, "Timed out waiting for an analysis slot", self._retry_after())
+            raise
+        self._waits.append(time.monotonic() - t)
+        self._counters["admitted"] += 1
+
+    def _leave(self, account: str) -> None:
+        self._per_account[account] -= 1
+        if not self._per_account[account]:
+            del self._per_account[account]
+
+    def release(self, account: str, service_s: float = None) -> None:
+        self._running -= 1
+        self._leave(account)
+        if service_s is not None:
+            self._service_s = 0.8 * self._service_s + 0.2 * service_s
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, account: str):
+        await self.acquire(account)
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(account, time.monotonic() - t)
+
+
+controller = AdmissionController()
@@ -0,0 +1,389 @@
+# cache.py
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# =====================================================
+# CACHE COMPARTILHADO ENTRE WORKERS
+# =====================================================
+# Com vários workers uvicorn/gunicorn um cache em memória fica duplicado
+# e frio em cada processo. CACHE_URL escolhe o backend:
+#   memory://                 -> por processo (padrão)
+#   sqlite:////tmp/cache.db   -> arquivo SQLite em WAL, compartilhado na máquina
+#   redis://host:6379/0       -> Redis (pacote `redis`)
+#   redis+local://            -> stand-in local compatível com Redis (testes/dev)
+
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "30"))  # segundos
+_COMPRESS_MIN = 512  # bytes
+
+# =====================================================
+# SERIALIZAÇÃO COMPACTA
+# =====================================================
+# JSON sem espaços; acima de _COMPRESS_MIN bytes vai com zlib.
+# O primeiro byte indica o formato.
+
+def dumps(obj: Any) -> bytes:
+    raw = json.dumps(obj, separators=(",", ":")).encode()
+    if len(raw) >= _COMPRESS_MIN:
+        return b"z" + zlib.compress(raw, 1)
+    return b"j" + raw
+
+def loads(data: bytes) -> Any:
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+# =====================================================
+# BACKENDS
+# =====================================================
+# Interface mínima:
+#   get(key) -> bytes | None
+#   set(key, value, ttl)
+#   add(key, value, ttl) -> bool   (só grava se ausente/expirado)
+#   delete(key)
+#   hincr(key, field, ttl)          (contador por campo, atômico)
+#   hgetall(key) -> {field: int}
+# Código async usa as versões aget/aset/aadd/adelete/ahincr/ahgetall:
+# SQLite e Redis fazem I/O e não podem travar o event loop.
+
+class _InlineAsync:
+    """Versões async que chamam as síncronas direto (backend sem I/O)"""
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None:
+        self.set(key, value, ttl)
+
+    async def aadd(self, key: str, value: bytes, ttl: float) -> bool:
+        return self.add(key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+    async def ahincr(self, key: str, field: str, ttl: float) -> None:
+        self.hincr(key, field, ttl)
+
+    async def ahgetall(self, key: str) -> Dict[str, int]:
+        return self.hgetall(key)
+
+
+class _ThreadedAsync:
+    """Versões async num thread do executor: o event loop não espera disco/lock"""
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    async def aadd(self, key: str, value: bytes, ttl: float) -> bool:
+        return await asyncio.to_thread(self.add, key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        await asyncio.to_thread(self.delete, key)
+
+    async def ahincr(self, key: str, field: str, ttl: float) -> None:
+        await asyncio.to_thread(self.hincr, key, field, ttl)
+
+    async def ahgetall(self, key: str) -> Dict[str, int]:
+        return await asyncio.to_thread(self.hgetall, key)
+
+
+class MemoryCache(_InlineAsync):
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, bytes]] = {}
+        self._hashes: Dict[str, Tuple[float, Dict[str, int]]] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        hit = self._data.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= time.time():
+            self._data.pop(key, None)
+            return None
+        return hit[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._data[key] = (now + ttl, value)
+            # chaves lidas uma vez só (ex.: llm:<hash>) não passam de novo pelo get
+            if random.random() < 0.01:
+                self._purge(now)
+
+    def _purge(self, now: float) -> None:
+        for key in [k for k, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[key]
+        for key in [k for k, (expires, _) in self._hashes.items() if expires <= now]:
+            del self._hashes[key]
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self.get(key) is not None:
+                return False
+            self.set(key, value, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def hincr(self, key: str, field: str, ttl: float) -> None:
+        with self._lock:
+            expires, fields = self._hashes.get(key, (0.0, {}))
+            if expires <= time.time():
+                fields = {}
+            fields[field] = fields.get(field, 0) + 1
+            self._hashes[key] = (time.time() + ttl, fields)
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        expires, fields = self._hashes.get(key, (0.0, {}))
+        return dict(fields) if expires > time.time() else {}
+
+
+class SQLiteCache(_ThreadedAsync):
+    """Arquivo SQLite em modo WAL: leitores não bloqueiam o escritor"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS counters (key TEXT NOT NULL, field TEXT NOT NULL, "
+            "value INTEGER NOT NULL, expires REAL NOT NULL, PRIMARY KEY (key, field))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, now + ttl))
+        if random.random() < 0.01:
+            conn.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE kv.expires <= ?",
+            (key, value, now + ttl, now),
+        )
+        return cur.rowcount > 0
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def hincr(self, key: str, field: str, ttl: float) -> None:
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO counters (key, field, value, expires) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(key, field) DO UPDATE SET "
+            "value = CASE WHEN counters.expires > ? THEN counters.value + 1 ELSE 1 END, "
+            "expires = excluded.expires",
+            (key, field, now + ttl, now),
+        )
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        rows = self._conn().execute(
+            "SELECT field, value FROM counters WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchall()
+        return dict(rows)
+
+
+class RedisCache(_InlineAsync):
+    """
+    Qualquer cliente com a API do redis-py (get/set com nx/px/delete).
+    `async_factory` cria o cliente redis.asyncio usado pelas versões a*;
+    um por event loop (o worker roda precompute/live em threads com loop
+    próprio). Sem factory (LocalRedis) as versões a* chamam o síncrono.
+    """
+
+    def __init__(self, client, async_factory: Optional[Callable[[], Any]] = None):
+        self.client = client
+        self._async_factory = async_factory
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    def _aclient(self):
+        if self._async_factory is None:
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = self._async_factory()
+        return client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(self.client.set(key, value, nx=True, px=max(1, int(ttl * 1000))))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def hincr(self, key: str, field: str, ttl: float) -> None:
+        self.client.hincrby(key, field, 1)
+        self.client.pexpire(key, max(1, int(ttl * 1000)))
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        return {
+            (f.decode() if isinstance(f, bytes) else f): int(v)
+            for f, v in self.client.hgetall(key).items()
+        }
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        client = self._aclient()
+        return self.get(key) if client is None else await client.get(key)
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None:
+        client = self._aclient()
+        if client is None:
+            return self.set(key, value, ttl)
+        await client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def aadd(self, key: str, value: bytes, ttl: float) -> bool:
+        client = self._aclient()
+        if client is None:
+            return self.add(key, value, ttl)
+        return bool(await client.set(key, value, nx=True, px=max(1, int(ttl * 1000))))
+
+    async def adelete(self, key: str) -> None:
+        client = self._aclient()
+        if client is None:
+            return self.delete(key)
+        await client.delete(key)
+
+    async def ahincr(self, key: str, field: str, ttl: float) -> None:
+        client = self._aclient()
+        if client is None:
+            return self.hincr(key, field, ttl)
+        await client.hincrby(key, field, 1)
+        await client.pexpire(key, max(1, int(ttl * 1000)))
+
+    async def ahgetall(self, key: str) -> Dict[str, int]:
+        client = self._aclient()
+        if client is None:
+            return self.hgetall(key)
+        return {
+            (f.decode() if isinstance(f, bytes) else f): int(v)
+            for f, v in (await client.hgetall(key)).items()
+        }
+
+
+class LocalRedis:
+    """Stand-in em memória com o subconjunto do redis-py usado aqui"""
+
+    def __init__(self):
+        self._mem = MemoryCache()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._mem.get(key)
+
+    def set(self, key: str, value: bytes, nx: bool = False, px: Optional[int] = None) -> Optional[bool]:
+        ttl = (px / 1000) if px else 10 ** 9
+        if nx:
+            return self._mem.add(key, value, ttl) or None
+        self._mem.set(key, value, ttl)
+        return True
+
+    def delete(self, key: str) -> int:
+        existed = self._mem.get(key) is not None
+        self._mem.delete(key)
+        return int(existed)
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        expires, fields = self._mem._hashes.get(key, (float("inf"), {}))
+        fields[field] = fields.get(field, 0) + amount
+        self._mem._hashes[key] = (expires, fields)
+        return fields[field]
+
+    def pexpire(self, key: str, px: int) -> bool:
+        if key not in self._mem._hashes:
+            return False
+        self._mem._hashes[key] = (time.time() + px / 1000, self._mem._hashes[key][1])
+        return True
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        return self._mem.hgetall(key)
+
+
+def from_url(url: str):
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):])
+    if url.startswith("redis+local://"):
+        return RedisCache(LocalRedis())
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from startup import lazy_import
+        redis = lazy_import("redis")
+        return RedisCache(redis.Redis.from_url(url), lambda: lazy_import("redis.asyncio").Redis.from_url(url))
+    return MemoryCache()
+
+
+_backend = None
+
+def get_cache():
+    global _backend
+    if _backend is None:
+        _backend = from_url(CACHE_URL)
+    return _backend
+
+# =====================================================
+# GET-OR-SET COM PROTEÇÃO CONTRA STAMPEDE
+# =====================================================
+# Só quem conseguir o lock "lock:<key>" chama o loader; os demais
+# (de qualquer worker) aguardam o valor aparecer. Se o dono do lock
+# falhar ou sumir, o próximo a pegar o lock tenta de novo.
+
+async def get_or_set(key: str, ttl: float, loader: Callable[[], Awaitable[Any]],
+                     lock_ttl: float = CACHE_LOCK_TTL, refresh: bool = False) -> Any:
+    """refresh=True ignora o valor atual e recarrega (ainda sob o lock)"""
+    backend = get_cache()
+    lock_key = f"lock:{key}"
+    deadline = time.monotonic() + lock_ttl
+    delay = 0.02
+    while True:
+        raw = None if refresh else await backend.aget(key)
+        if raw is not None:
+            return loads(raw)
+        owner = await backend.aadd(lock_key, b"1", lock_ttl)
+        if owner or time.monotonic() >= deadline:
+            break
+        refresh = False  # outro processo já está recarregando: serve o dele
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.25)
+    try:
+        value = await loader()
+        await backend.aset(key, dumps(value), ttl)
+        return value
+    finally:
+        if owner:
+            await backend.adelete(lock_key)
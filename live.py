@@ -0,0 +1,351 @@
+# live.py
+import asyncio
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from schemas import Candle
+
+# =====================================================
+# AGREGADOR DE CANDLES AO VIVO
+# =====================================================
+# Consome aggTrade + kline do WebSocket da Binance (ou um arquivo de
+# replay) e mantém, por (symbol, intervalo), o candle em formação e um
+# ring buffer dos candles fechados em arrays compactos (8 bytes/campo).
+# O /analyze e o avaliador de watches leem daqui sem ida ao REST.
+
+LIVE_SYMBOLS = [s.strip().upper() for s in os.getenv("LIVE_SYMBOLS", "").split(",") if s.strip()]
+LIVE_INTERVALS = [i.strip() for i in os.getenv("LIVE_INTERVALS", "1h,4h,1d").split(",") if i.strip()]
+LIVE_BUFFER = int(os.getenv("LIVE_BUFFER", "1000"))  # candles fechados por série
+LIVE_WS_BASE = os.getenv("LIVE_WS_BASE", "wss://stream.binance.com:9443")
+LIVE_REPLAY_FILE = os.getenv("LIVE_REPLAY_FILE", "")  # .jsonl (mensagens WS) ou .csv (aggTrades)
+LIVE_REPLAY_SYMBOL = os.getenv("LIVE_REPLAY_SYMBOL", "")  # símbolo do .csv
+LIVE_STALE_AFTER = float(os.getenv("LIVE_STALE_AFTER", "30"))  # s sem mensagens -> volta ao REST
+
+_STEPS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400, "1d": 86400}
+
+
+class CandleSeries:
+    """Candle em formação + ring buffer de candles fechados (colunas em array)"""
+
+    __slots__ = ("step", "cap", "t", "o", "h", "l", "c", "v", "head", "size",
+                 "cur_t", "cur_o", "cur_h", "cur_l", "cur_c", "cur_v", "cur_closed")
+
+    def __init__(self, step: int, cap: int = LIVE_BUFFER):
+        self.step = step
+        self.cap = cap
+        self.t = array("q", bytes(8 * cap))
+        self.o = array("d", bytes(8 * cap))
+        self.h = array("d", bytes(8 * cap))
+        self.l = array("d", bytes(8 * cap))
+        self.c = array("d", bytes(8 * cap))
+        self.v = array("d", bytes(8 * cap))
+        self.head = 0  # próxima posição de escrita
+        self.size = 0
+        self.cur_t = -1  # sem candle em formação
+        self.cur_o = self.cur_h = self.cur_l = self.cur_c = self.cur_v = 0.0
+        self.cur_closed = False  # kline fechado oficial já gravado para cur_t
+
+    # ---------------- escrita ----------------
+
+    def _index_of(self, t: int) -> int:
+        """Posição de `t` no buffer (-1 se ausente); os candles são contíguos"""
+        if not self.size:
+            return -1
+        last = (self.head - 1) % self.cap
+        back = (self.t[last] - t) // self.step
+        if back < 0 or back >= self.size:
+            return -1
+        i = (last - back) % self.cap
+        return i if self.t[i] == t else -1
+
+    def _push(self, t: int, o: float, h: float, l: float, c: float, v: float) -> None:
+        i = self._index_of(t)  # correção de um candle já fechado
+        if i < 0:
+            i = self.head
+            self.head = (self.head + 1) % self.cap
+            self.size = min(self.size + 1, self.cap)
+        self.t[i], self.o[i], self.h[i], self.l[i], self.c[i], self.v[i] = t, o, h, l, c, v
+
+    def _roll(self, start: int) -> None:
+        """Fecha o candle atual e abre `start`, preenchendo buckets sem trades"""
+        if self.cur_t >= 0:
+            if not self.cur_closed:
+                self._push(self.cur_t, self.cur_o, self.cur_h, self.cur_l, self.cur_c, self.cur_v)
+            prev = self.cur_c
+            gap_t = self.cur_t + self.step
+            if (start - gap_t) // self.step > self.cap:
+                gap_t = start - self.cap * self.step
+            while gap_t < start:  # igual à Binance: O=H=L=C=último close, volume 0
+                self._push(gap_t, prev, prev, prev, prev, 0.0)
+                gap_t += self.step
+        self.cur_t = start
+        self.cur_closed = False
+
+    def add_trade(self, ts: int, price: float, qty: float) -> None:
+        """ts em segundos. Caminho quente: poucas comparações por trade."""
+        start = ts - ts % self.step
+        if start == self.cur_t:
+            if self.cur_closed:
+                return  # trade atrasado: o kline fechado oficial prevalece
+            if price > self.cur_h:
+                self.cur_h = price
+            elif price < self.cur_l:
+                self.cur_l = price
+            self.cur_c = price
+            self.cur_v += qty
+        elif start > self.cur_t:
+            self._roll(start)
+            self.cur_o = self.cur_h = self.cur_l = self.cur_c = price
+            self.cur_v = qty
+        # trade atrasado de um candle já fechado: o kline fechado corrige
+
+    def set_kline(self, t: int, o: float, h: float, l: float, c: float, v: float, closed: bool) -> None:
+        """Valores oficiais do stream de kline (ou seed via REST)"""
+        if t < self.cur_t:
+            # kline fechado que chegou depois do bucket seguinte já ter aberto
+            if closed and self._index_of(t) >= 0:
+                self._push(t, o, h, l, c, v)
+            return
+        if t > self.cur_t:
+            self._roll(t)
+        elif self.cur_closed and not closed:
+            return  # update parcial atrasado de um bucket já fechado
+        self.cur_o, self.cur_h, self.cur_l, self.cur_c, self.cur_v = o, h, l, c, v
+        if closed:
+            self._push(t, o, h, l, c, v)
+            self.cur_closed = True  # cur_t fica até chegar trade/kline do próximo bucket
+
+    # ---------------- leitura ----------------
+
+    def candles(self, limit: Optional[int] = None, include_forming: bool = True) -> List[Candle]:
+        forming = include_forming and self.cur_t >= 0 and self._index_of(self.cur_t) < 0
+        n = self.size if limit is None else min(self.size, max(0, limit - (1 if forming else 0)))
+        out = []
+        for k in range(self.size - n, self.size):
+            i = (self.head - self.size + k) % self.cap
+            out.append(Candle(time=self.t[i], open=self.o[i], high=self.h[i],
+                              low=self.l[i], close=self.c[i], volume=self.v[i]))
+        if forming:
+            out.append(Candle(time=self.cur_t, open=self.cur_o, high=self.cur_h,
+                              low=self.cur_l, close=self.cur_c, volume=self.cur_v))
+        return out
+
+    def __len__(self) -> int:
+        return self.size + (1 if self.cur_t >= 0 and not self.cur_closed else 0)
+
+
+class LiveAggregator:
+    def __init__(self, intervals: List[str] = LIVE_INTERVALS, cap: int = LIVE_BUFFER):
+        self.intervals = [i for i in intervals if i in _STEPS]
+        self.cap = cap
+        self._series: Dict[str, List[Tuple[str, CandleSeries]]] = {}
+        self._last_price: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._seeded: Dict[Tuple[str, str], bool] = {}
+        self.trades = 0
+        self.messages = 0
+
+    def _for(self, symbol: str) -> List[Tuple[str, CandleSeries]]:
+        series = self._series.get(symbol)
+        if series is None:
+            series = [(i, CandleSeries(_STEPS[i], self.cap)) for i in self.intervals]
+            self._series[symbol] = series
+        return series
+
+    def series(self, symbol: str, interval: str) -> Optional[CandleSeries]:
+        for i, s in self._series.get(symbol, ()):
+            if i == interval:
+                return s
+        return None
+
+    # ---------------- entrada ----------------
+
+    def on_trade(self, symbol: str, ts_ms: int, price: float, qty: float) -> None:
+        ts = ts_ms // 1000
+        for _, s in self._for(symbol):
+            s.add_trade(ts, price, qty)
+        self._last_price[symbol] = price
+        self._updated[symbol] = time.time()
+        self.trades += 1
+
+    def on_trades(self, symbol: str, ts_ms: Iterable[int], prices: Iterable[float], qtys: Iterable[float]) -> None:
+        """Lote de trades do mesmo símbolo (replay/backfill): evita overhead por chamada"""
+        series = [s.add_trade for _, s in self._for(symbol)]
+        n = 0
+        price = None
+        for ts, price, qty in zip(ts_ms, prices, qtys):
+            ts //= 1000
+            for add in series:
+                add(ts, price, qty)
+            n += 1
+        if price is not None:
+            self._last_price[symbol] = price
+            self._updated[symbol] = time.time()
+        self.trades += n
+
+    def on_kline(self, symbol: str, interval: str, t_ms: int, o: float, h: float, l: float,
+                 c: float, v: float, closed: bool) -> None:
+        s = self.series(symbol, interval)
+        if s is None:
+            if interval not in self.intervals:
+                return
+            self._for(symbol)
+            s = self.series(symbol, interval)
+        s.set_kline(t_ms // 1000, o, h, l, c, v, closed)
+        self._last_price[symbol] = c
+        self._updated[symbol] = time.time()
+
+    def on_message(self, msg: Dict[str, Any]) -> None:
+        """Mensagem do WebSocket (combined stream ou raw)"""
+        data = msg.get("data", msg)
+        event = data.get("e")
+        self.messages += 1
+        if event == "aggTrade" or event == "trade":
+            self.on_trade(data["s"], data["T"], float(data["p"]), float(data["q"]))
+        elif event == "kline":
+            k = data["k"]
+            self.on_kline(data["s"], k["i"], k["t"], float(k["o"]), float(k["h"]), float(k["l"]),
+                          float(k["c"]), float(k["v"]), bool(k["x"]))
+
+    def seed(self, symbol: str, interval: str, candles: List[Candle]) -> None:
+        """Histórico inicial via REST; o último candle vira o candle em formação"""
+        for i, c in enumerate(candles):
+            self.on_kline(symbol, interval, c.time * 1000, c.open, c.high, c.low, c.close, c.volume,
+                          i < len(candles) - 1)
+        self._seeded[(symbol, interval)] = True
+
+    def mark_ready(self, symbol: str, pinned: bool = False) -> None:
+        """Libera a leitura sem seed via REST; pinned = nunca considerar velho (replay)"""
+        for interval in self.intervals:
+            self._seeded[(symbol, interval)] = True
+        if pinned:
+            self._updated[symbol] = float("inf")
+
+    # ---------------- leitura ----------------
+
+    def is_live(self, symbol: str) -> bool:
+        return time.time() - self._updated.get(symbol, 0.0) < LIVE_STALE_AFTER
+
+    def get_candles(self, symbol: str, interval: str, limit: int) -> Optional[List[Candle]]:
+        """Candles ao vivo, ou None se a série não estiver pronta (semeada e recente)"""
+        if not (self._seeded.get((symbol, interval)) and self.is_live(symbol)):
+            return None
+        return self.series(symbol, interval).candles(limit)
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        return self._last_price.get(symbol) if self.is_live(symbol) else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "trades": self.trades,
+            "messages": self.messages,
+            "symbols": {
+                symbol: {
+                    "live": self.is_live(symbol),
+                    "lastPrice": self._last_price.get(symbol),
+                    "bars": {i: len(s) for i, s in series},
+                }
+                for symbol, series in self._series.items()
+            },
+        }
+
+
+aggregator = LiveAggregator()
+
+# =====================================================
+# FONTES: WebSocket da Binance e arquivo de replay
+# =====================================================
+
+async def _seed_from_rest(symbols: List[str]) -> None:
+    from services import get_multi_tf_candles
+
+    for symbol in symbols:
+        try:
+            mtf = await get_multi_tf_candles(
+                symbol, [i for i in aggregator.intervals if i in ("1h", "4h", "1d")], refresh=True)
+            for interval, (candles, _) in mtf.items():
+                aggregator.seed(symbol, interval, candles[-aggregator.cap:])
+        except Exception as e:
+            print(f"Live seed error {symbol}: {e}", file=sys.stderr, flush=True)
+
+async def run_websocket(symbols: List[str] = LIVE_SYMBOLS) -> None:
+    from startup import lazy_import
+
+    websockets = lazy_import("websockets")
+    streams = "/".join(
+        [f"{s.lower()}@aggTrade" for s in symbols]
+        + [f"{s.lower()}@kline_{i}" for s in symbols for i in aggregator.intervals]
+    )
+    url = f"{LIVE_WS_BASE}/stream?streams={streams}"
+    await _seed_from_rest(symbols)
+    delay = 1.0
+    while True:
+        try:
+            async with websockets.connect(url, ping_interval=20, max_size=2 ** 20) as ws:
+                print(f"Live stream connected: {len(symbols)} symbols", flush=True)
+                delay = 1.0
+                async for raw in ws:
+                    aggregator.on_message(json.loads(raw))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Live stream error: {e} (reconnecting in {delay:.0f}s)", file=sys.stderr, flush=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+            await _seed_from_rest(symbols)  # cobre o buraco da desconexão
+
+def replay_file(path: str = LIVE_REPLAY_FILE, symbol: str = LIVE_REPLAY_SYMBOL) -> int:
+    """
+    Alimenta o agregador com um arquivo local:
+    - .csv de aggTrades no formato do data.binance.vision
+      (id, price, qty, first_id, last_id, timestamp_ms, is_buyer_maker, ...)
+    - .jsonl com uma mensagem do WebSocket por linha
+    """
+    if path.endswith(".csv"):
+        ts_ms: List[int] = []
+        prices: List[float] = []
+        qtys: List[float] = []
+        with open(path, newline="") as f:
+            for row in csv.reader(f):
+                if not row or not row[0].isdigit():
+                    continue  # cabeçalho
+                prices.append(float(row[1]))
+                qtys.append(float(row[2]))
+                ts_ms.append(int(row[5]) // 1000 if len(row[5]) > 13 else int(row[5]))  # µs -> ms
+        symbol = symbol.upper()
+        aggregator.on_trades(symbol, ts_ms, prices, qtys)
+        aggregator.mark_ready(symbol, pinned=True)
+        return len(ts_ms)
+    n = 0
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                aggregator.on_message(json.loads(line))
+                n += 1
+    for symbol in list(aggregator._series):
+        aggregator.mark_ready(symbol, pinned=True)
+    return n
+
+async def run() -> None:
+    """Fonte configurada: replay (LIVE_REPLAY_FILE) ou WebSocket (LIVE_SYMBOLS)"""
+    if LIVE_REPLAY_FILE:
+        t = time.perf_counter()
+        n = await asyncio.to_thread(replay_file)
+        print(f"Live replay: {n} records in {time.perf_counter() - t:.2f}s", flush=True)
+    elif LIVE_SYMBOLS:
+        await run_websocket()
+
+def enabled() -> bool:
+    return bool(LIVE_REPLAY_FILE or LIVE_SYMBOLS)
+
+def start_in_thread() -> threading.Thread:
+    """Roda a fonte num thread com event loop próprio (usado pelo worker.py)"""
+    t = threading.Thread(target=lambda: asyncio.run(run()), name="live", daemon=True)
+    t.start()
+    return t
@@ -1,27 +1,60 @@
+import hashlib
 import json
 import os
+import threading
 from typing import Dict, Any, List, Optional
 from schemas import Suggestion
+from startup import lazy_import
 
 # =====================================================
 # SUPORTE A MÚLTIPLAS APIS (Claude + OpenAI)
 # =====================================================
+# O SDK do provedor só é importado/instanciado no primeiro uso
+# (ou no warm-up do lifespan), para não pesar no cold start.
 
 _PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" ou "claude"
 _client = None
-
-if _PROVIDER == "claude":
-    try:
-        from anthropic import Anthropic
-        _client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    except Exception:
-        _client = None
-elif _PROVIDER == "openai":
+_client_loaded = False
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client, _client_loaded
+    if _client_loaded:
+        return _client
+    with _client_lock:
+        if _client_loaded:
+            return _client
+        if _PROVIDER == "claude":
+            try:
+                Anthropic = lazy_import("anthropic").Anthropic
+                _client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+            except Exception:
+                _client = None
+        elif _PROVIDER == "openai":
+            try:
+                OpenAI = lazy_import("openai").OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            except Exception:
+                _client = None
+        _client_loaded = True
+    return _client
+
+def warmup() -> str:
+    """Carrega o SDK e abre a conexão TLS com o provedor (sem gerar tokens)"""
+    client = _get_client()
+    if not client:
+        raise RuntimeError("LLM client not available")
     try:
-        from openai import OpenAI
-        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    except Exception:
-        _client = None
+        if _PROVIDER == "openai":
+            client.models.list()
+        else:
+            client.get("/v1/models", cast_to=object)
+    except Exception as e:
+        # Um erro HTTP (ex.: 404) ainda deixa a conexão aberta no pool
+        if getattr(e, "status_code", None) is None:
+            raise
+        return f"{_PROVIDER} connected (status {e.status_code})"
+    return f"{_PROVIDER} connected"
 
 # =====================================================
 # HELPER: Coerce Suggestion
@@ -285,6 +318,20 @@ Retorne APENAS um JSON válido (sem markdown, sem ```):
 
     return prompt
 
+def source_label() -> str:
+    """Rótulo do campo `source` do /analyze"""
+    return "gpt-4o-mini" if os.getenv("LLM_PROVIDER") == "openai" else "claude-sonnet-4"
+
+def suggestion_cache_key(
+    baseline: Dict[str, float],
+    split: List[float],
+    technical_context: Optional[Dict[str, Any]] = None
+) -> str:
+    """Chave de cache: provedor + modelo + tudo que entra no prompt"""
+    model = os.getenv("CLAUDE_MODEL" if _PROVIDER == "claude" else "OPENAI_MODEL", "")
+    raw = json.dumps([baseline, split, technical_context], sort_keys=True, separators=(",", ":"))
+    return f"llm:{_PROVIDER}:{model}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
 # =====================================================
 # FUNÇÃO PRINCIPAL: Try LLM Suggestion
 # =====================================================
@@ -299,7 +346,8 @@ def try_llm_suggestion(
     com análise técnica enriquecida
     """
     
-    if not _client:
+    client = _get_client()
+    if not client:
         raise RuntimeError("LLM client not available")
     
     prompt = build_enhanced_prompt(baseline, split, technical_context)
@@ -309,7 +357,7 @@ def try_llm_suggestion(
         try:
             model = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
             
-            message = _client.messages.create(
+            message = client.messages.create(
                 model=model,
                 max_tokens=2000,
                 temperature=0.3,  # Mais conservador
@@ -339,7 +387,7 @@ def try_llm_suggestion(
         try:
             model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
             
-            response = _client.chat.completions.create(
+            response = client.chat.completions.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -1,22 +1,68 @@
+import asyncio
 import os
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
-from schemas import AnalyzeIn, AnalyzeOut, Suggestion
-from services import (
-    fetch_binance_klines, 
-    TF_TO_BINANCE, 
-    compute_baseline, 
-    build_rules_fallback, 
-    rr_from
-)
-from llm import try_llm_suggestion
+from contextlib import asynccontextmanager
+import startup  # primeiro import: marca o início do perfil de cold start
+
+with startup.timed_import("fastapi"):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+from typing import Dict, Optional
+with startup.timed_import("schemas"):
+    from schemas import AnalyzeIn, AnalyzeOut, BaselineOut, Suggestion, TimeframeBaseline, ScreenerOut
+with startup.timed_import("services"):
+    from services import (
+        get_mtf_baselines,
+        peek_mtf_baselines,
+        close_http_client,
+        TF_TO_BINANCE, 
+        compute_baseline, 
+        build_rules_fallback, 
+        rr_from
+    )
+with startup.timed_import("ratelimit"):
+    from ratelimit import BinanceRateLimited, governor
+with startup.timed_import("cache"):
+    from cache import get_or_set
+with startup.timed_import("admission"):
+    from admission import AdmissionRejected, ADMISSION_OVERLOAD, controller as admission
+with startup.timed_import("llm"):
+    from llm import try_llm_suggestion, suggestion_cache_key, source_label
+with startup.timed_import("live"):
+    import live
+with startup.timed_import("precompute"):
+    from precompute import record_request, get_precomputed, PRECOMPUTE_SPLIT
+with startup.timed_import("screener"):
+    from screener import run_screener
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))  # segundos
 
 ALLOWED_ORIGINS = [o.strip() for o in os.getenv("ALLOWED_ORIGINS","").split(",") if o.strip()]
 if not ALLOWED_ORIGINS:
     ALLOWED_ORIGINS = ["*"]
 
-app = FastAPI(title="kelisson-trading-ia-backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # WARMUP_MODE=blocking segura o startup até o warm-up terminar;
+    # background libera o health imediatamente e aquece em paralelo
+    # (depois, keep_warm recarrega as entradas até chegar o primeiro /analyze)
+    warm_task = None
+    if startup.WARMUP_MODE == "blocking":
+        await startup.warmup()
+        warm_task = asyncio.create_task(startup.keep_warm())
+    elif startup.WARMUP_MODE == "background":
+        async def warm():
+            await startup.warmup()
+            await startup.keep_warm()
+        warm_task = asyncio.create_task(warm())
+    # Candles ao vivo via WebSocket/replay (LIVE_SYMBOLS / LIVE_REPLAY_FILE)
+    live_task = asyncio.create_task(live.run()) if live.enabled() else None
+    yield
+    for task in (warm_task, live_task):
+        if task and not task.done():
+            task.cancel()
+    await close_http_client()
+
+app = FastAPI(title="kelisson-trading-ia-backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,8 +74,110 @@ app.add_middleware(
 
 @app.get("/")
 def health():
+    startup.mark_healthy()
     return {"ok": True, "service": "kelisson-trading-ia-backend", "version": "2.0-enhanced"}
 
+@app.get("/startup")
+def startup_profile():
+    """Breakdown de imports, warm-up e tempo até a primeira resposta saudável"""
+    return startup.report()
+
+@app.get("/binance/weight")
+def binance_weight():
+    """Peso da Binance usado na janela atual (compartilhado via BINANCE_WEIGHT_FILE)"""
+    return governor.snapshot()
+
+@app.get("/live")
+def live_stats():
+    """Estado do agregador ao vivo: trades processados e candles por série"""
+    return live.aggregator.stats()
+
+@app.get("/admission")
+def admission_stats():
+    """Profundidade da fila, slots em uso e tempo de espera do estágio do LLM"""
+    return admission.stats()
+
+@app.get("/screener", response_model=ScreenerOut)
+async def screener(tf: str = "4h", limit: int = 50, trend: Optional[str] = None):
+    """Baseline + regras + technical context de todo o universo, sem LLM"""
+    interval = TF_TO_BINANCE.get(tf)
+    if interval is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported tf: {tf}")
+    if trend is not None and trend not in ("up", "down", "flat"):
+        raise HTTPException(status_code=400, detail=f"Unsupported trend: {trend}")
+    try:
+        out = await run_screener(interval, trend, max(1, min(limit, 500)))
+    except BinanceRateLimited as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Binance error: {e}")
+    return ScreenerOut(ok=True, tf=tf, **out)
+
+# =====================================================
+# FALLBACK: Regras Objetivas
+# =====================================================
+
+def rules_fallback_suggestion(base, use_split, technical_context) -> Suggestion:
+    lvls = build_rules_fallback(base)
+    rr1, rr2, rr3 = rr_from(lvls, use_split)
+    
+    # Se tiver technical context, ajustar confiança baseado na qualidade
+    confidence = 55
+    if technical_context:
+        quality = technical_context.get('quality', 'razoável')
+        if quality == 'excelente':
+            confidence = 70
+        elif quality == 'boa':
+            confidence = 65
+        elif quality == 'razoável':
+            confidence = 55
+        else:  # ruim
+            confidence = 45
+    elif base.trend != "flat":
+        confidence = 55
+    else:
+        confidence = 50
+    
+    rationale = f"""⚠️ FALLBACK: Análise baseada em regras objetivas
+
+Tendência: {base.trend.upper()}
+ATR: ${base.atr14:.2f}
+        
+O plano foi gerado usando:
+• Entradas baseadas em distâncias de ATR a partir do preço atual
+• Stop loss calculado considerando suporte e volatilidade
+• Take profits em níveis de resistência estimados
+
+"""
+    if technical_context:
+        warnings = technical_context.get('warnings', [])
+        if warnings:
+            rationale += f"\nAvisos técnicos:\n"
+            for w in warnings:
+                rationale += f"• {w}\n"
+    
+    rationale += f"\nRecomendação: Valide manualmente antes de operar."
+    
+    return Suggestion(
+        E1=lvls["E1"], 
+        E2=lvls["E2"], 
+        E3=lvls["E3"],
+        stop=lvls["stop"],
+        TP1=lvls["TP1"], 
+        TP2=lvls["TP2"], 
+        TP3=lvls["TP3"],
+        RR1=rr1, 
+        RR2=rr2, 
+        RR3=rr3,
+        confidence=confidence,
+        rationale=rationale.strip(),
+        trend=base.trend
+    )
+
 @app.post("/analyze", response_model=AnalyzeOut)
 async def analyze(payload: AnalyzeIn):
     """
@@ -40,18 +188,58 @@ async def analyze(payload: AnalyzeIn):
     # =====================================================
     # 1) OBTER CANDLES
     # =====================================================
+    # Só o TF pedido vai à rede (ou sai do 1h já em cache/ao vivo,
+    # reamostrado); os outros TFs do `mtf` vêm do cache compartilhado
     candles = payload.candles
-    if not candles or len(candles) < 50:
-        interval = TF_TO_BINANCE.get(payload.tf, "4h")
-        try:
-            candles = await fetch_binance_klines(payload.symbol, interval, 400)
-        except Exception as e:
+    interval = TF_TO_BINANCE.get(payload.tf, "4h")
+    need_fetch = not candles or len(candles) < 50
+    use_split = payload.context.split or [25, 50, 25]
+    startup.mark_request()
+    await record_request(payload.symbol, interval)
+
+    # Pré-calculado no último candle close (precompute.py): mesmos
+    # candles da Binance, split padrão e sem technicalContext do frontend
+    # (o pré-cálculo usa o do servidor) -> resposta pronta
+    if need_fetch and use_split == PRECOMPUTE_SPLIT and payload.technicalContext is None:
+        pre = await get_precomputed(payload.symbol, interval)
+        if pre:
+            print(f"⚡ Serving precomputed analysis for {payload.symbol} {interval}")
+            return AnalyzeOut(
+                ok=True,
+                source=pre["source"],
+                baseline=BaselineOut(**pre["baseline"]),
+                suggestion=Suggestion(**pre["suggestion"]),
+                mtf={iv: TimeframeBaseline(**b) for iv, b in pre["mtf"].items()} or None
+            )
+
+    try:
+        if need_fetch:
+            mtf_bases = await get_mtf_baselines(payload.symbol, [interval])
+        else:
+            # candles do cliente: sem rede; os outros TFs só se já estiverem no cache/ao vivo
+            mtf_bases = await peek_mtf_baselines(payload.symbol)
+    except BinanceRateLimited as e:
+        if need_fetch:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        mtf_bases = {}
+    except Exception as e:
+        if need_fetch:
             raise HTTPException(status_code=502, detail=f"Binance error: {e}")
+        print(f"⚠️  Multi-timeframe fetch failed: {e}")
+        mtf_bases = {}
 
     # =====================================================
     # 2) CALCULAR BASELINE
     # =====================================================
-    base = compute_baseline(candles)
+    if need_fetch:
+        base = mtf_bases[interval][0]
+    else:
+        base = compute_baseline(candles)
+        mtf_bases[interval] = (base, len(candles), "request")
     base_dict: Dict[str, float] = {
         "lastClose": base.lastClose,
         "ema50": base.ema50,
@@ -61,6 +249,17 @@ async def analyze(payload: AnalyzeIn):
         "trend": base.trend,
     }
 
+    mtf: Dict[str, TimeframeBaseline] = {
+        tf_interval: TimeframeBaseline(
+            trend=tf_base.trend,
+            atr14=tf_base.atr14,
+            lastClose=tf_base.lastClose,
+            bars=bars,
+            source=tf_source,
+        )
+        for tf_interval, (tf_base, bars, tf_source) in mtf_bases.items()
+    }
+
     # =====================================================
     # 3) EXTRAIR TECHNICAL CONTEXT (NOVO!)
     # =====================================================
@@ -80,19 +279,32 @@ async def analyze(payload: AnalyzeIn):
     # =====================================================
     # 4) TENTAR LLM COM CONTEXTO TÉCNICO
     # =====================================================
-    use_split = payload.context.split or [25, 50, 25]
-    
     try:
-        # Passa technical_context para a IA
-        sug: Suggestion = try_llm_suggestion(
-            base_dict, 
-            use_split,
-            technical_context  # ✨ NOVO: Passa análise técnica completa
-        )
-        source = "gpt-4o-mini" if os.getenv("LLM_PROVIDER") == "openai" else "claude-sonnet-4"
+        # Passa technical_context para a IA; mesma entrada -> mesma sugestão
+        # em qualquer worker (só um deles chama o LLM)
+        async def ask_llm():
+            # Só quem de fato chama o LLM passa pela admissão (hit de cache não)
+            async with admission.slot(payload.account_id):
+                out = await asyncio.to_thread(try_llm_suggestion, base_dict, use_split, technical_context)
+            return out.model_dump()
+        cache_key = suggestion_cache_key(base_dict, use_split, technical_context)
+        sug = Suggestion(**await get_or_set(cache_key, LLM_CACHE_TTL, ask_llm))
+        source = source_label()
         
         print(f"✅ LLM analysis complete (confidence: {sug.confidence}%)")
         
+    except AdmissionRejected as e:
+        if ADMISSION_OVERLOAD != "downgrade":
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        print(f"🚦 Admission: {e} (account {payload.account_id})")
+        print("🔄 Downgrading to rules-based plan...")
+        sug = rules_fallback_suggestion(base, use_split, technical_context)
+        source = "rules-fallback"
+
     except Exception as e:
         print(f"❌ LLM failed: {e}")
         print("🔄 Using rules-based fallback...")
@@ -100,61 +312,7 @@ async def analyze(payload: AnalyzeIn):
         # =====================================================
         # 5) FALLBACK: Regras Objetivas
         # =====================================================
-        lvls = build_rules_fallback(base)
-        rr1, rr2, rr3 = rr_from(lvls, use_split)
-        
-        # Se tiver technical context, ajustar confiança baseado na qualidade
-        confidence = 55
-        if technical_context:
-            quality = technical_context.get('quality', 'razoável')
-            if quality == 'excelente':
-                confidence = 70
-            elif quality == 'boa':
-                confidence = 65
-            elif quality == 'razoável':
-                confidence = 55
-            else:  # ruim
-                confidence = 45
-        elif base.trend != "flat":
-            confidence = 55
-        else:
-            confidence = 50
-        
-        rationale = f"""⚠️ FALLBACK: Análise baseada em regras objetivas
-
-Tendência: {base.trend.upper()}
-ATR: ${base.atr14:.2f}
-        
-O plano foi gerado usando:
-• Entradas baseadas em distâncias de ATR a partir do preço atual
-• Stop loss calculado considerando suporte e volatilidade
-• Take profits em níveis de resistência estimados
-
-"""
-        if technical_context:
-            warnings = technical_context.get('warnings', [])
-            if warnings:
-                rationale += f"\nAvisos técnicos:\n"
-                for w in warnings:
-                    rationale += f"• {w}\n"
-        
-        rationale += f"\nRecomendação: Valide manualmente antes de operar."
-        
-        sug = Suggestion(
-            E1=lvls["E1"], 
-            E2=lvls["E2"], 
-            E3=lvls["E3"],
-            stop=lvls["stop"],
-            TP1=lvls["TP1"], 
-            TP2=lvls["TP2"], 
-            TP3=lvls["TP3"],
-            RR1=rr1, 
-            RR2=rr2, 
-            RR3=rr3,
-            confidence=confidence,
-            rationale=rationale.strip(),
-            trend=base.trend
-        )
+        sug = rules_fallback_suggestion(base, use_split, technical_context)
         source = "rules-fallback"
 
     # =====================================================
@@ -164,5 +322,6 @@ O plano foi gerado usando:
         ok=True,
         source=source, 
         baseline=base,
-        suggestion=sug
+        suggestion=sug,
+        mtf=mtf or None
     )
\ No newline at end of file
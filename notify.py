@@ -5,23 +5,39 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 import requests
 
-import firebase_admin
-from firebase_admin import credentials, firestore, messaging
+from startup import lazy_import
+from ratelimit import governor, endpoint_weight
+from live import aggregator as live
 
 router = APIRouter(prefix="/notify", tags=["notify"])
 
+# firebase_admin é pesado: só é importado quando uma rota/scan realmente o usa
+def _firestore():
+    return lazy_import("firebase_admin.firestore")
+
+def _messaging():
+    return lazy_import("firebase_admin.messaging")
+
 def _ensure_firebase():
+    firebase_admin = lazy_import("firebase_admin")
     if not firebase_admin._apps:
         sa_json = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
         if not sa_json:
             raise RuntimeError("Missing GOOGLE_APPLICATION_CREDENTIALS_JSON")
+        credentials = lazy_import("firebase_admin.credentials")
         cred = credentials.Certificate(json.loads(sa_json))
         firebase_admin.initialize_app(cred)
-    return firestore.client()
+    return _firestore().client()
 
 def _binance_price(symbol: str) -> float:
+    price = live.last_price(symbol)  # stream ao vivo, se este processo o estiver consumindo
+    if price is not None:
+        return price
     base = os.environ.get("BINANCE_BASE_URL", "https://api.binance.com")
-    r = requests.get(f"{base}/api/v3/ticker/price", params={"symbol": symbol}, timeout=8)
+    params = {"symbol": symbol}
+    governor.acquire(endpoint_weight("/api/v3/ticker/price", params))
+    r = requests.get(f"{base}/api/v3/ticker/price", params=params, timeout=8)
+    governor.check(r.status_code, r.headers)
     r.raise_for_status()
     return float(r.json()["price"])
 
@@ -39,7 +55,7 @@ def subscribe(w: Watch):
     db = _ensure_firebase()
     doc_id = f"{w.account_id}:{w.scenario_id}"
     db.collection("watches").document(doc_id).set(
-        {**w.dict(), "active": True, "createdAt": firestore.SERVER_TIMESTAMP},
+        {**w.dict(), "active": True, "createdAt": _firestore().SERVER_TIMESTAMP},
         merge=True
     )
     return {"ok": True, "id": doc_id}
@@ -49,7 +65,7 @@ def unsubscribe(account_id: str, scenario_id: str):
     db = _ensure_firebase()
     doc_id = f"{account_id}:{scenario_id}"
     db.collection("watches").document(doc_id).set(
-        {"active": False, "disabledAt": firestore.SERVER_TIMESTAMP},
+        {"active": False, "disabledAt": _firestore().SERVER_TIMESTAMP},
         merge=True
     )
     return {"ok": True}
@@ -66,6 +82,7 @@ def _condition_ok(w: dict, price: float) -> bool:
     return False
 
 def _send_push(token: str, title: str, body: str, data: Dict[str, str] | None = None):
+    messaging = _messaging()
     data = {k: str(v) for k, v in (data or {}).items()}
     msg = messaging.Message(
         token=token,
@@ -97,7 +114,7 @@ def run_scan_once() -> int:
                     {"symbol": w["symbol"], "scenario_id": w["scenario_id"], "url": "/trade/trade_ia.html"}
                 )
                 db.collection("watches").document(doc.id).set(
-                    {"active": False, "notifiedAt": firestore.SERVER_TIMESTAMP, "lastPrice": price},
+                    {"active": False, "notifiedAt": _firestore().SERVER_TIMESTAMP, "lastPrice": price},
                     merge=True
                 )
                 sent += 1
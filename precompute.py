@@ -0,0 +1,178 @@
+# precompute.py
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import MemoryCache, get_cache, dumps, loads
+from services import INTERVAL_SECONDS, TF_TO_BINANCE, cache_mtf_baselines, compute_baseline, get_multi_tf_candles
+from technical import compute_technical_context
+from llm import try_llm_suggestion, source_label
+
+# =====================================================
+# PRÉ-CÁLCULO NO FECHAMENTO DO CANDLE
+# =====================================================
+# A cada close de 1h/4h/1d, atualiza klines, baseline, technical context
+# e a sugestão do LLM dos N pares (symbol, intervalo) mais pedidos no
+# /analyze. O resultado fica no cache compartilhado até o próximo close
+# e o /analyze o serve direto. Roda como processo próprio
+# (`python precompute.py`) ou dentro do worker (PRECOMPUTE_IN_WORKER=1);
+# em ambos os casos CACHE_URL precisa ser sqlite:// ou redis://.
+
+PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", "10"))
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "2"))  # chamadas simultâneas ao LLM
+PRECOMPUTE_JITTER = float(os.getenv("PRECOMPUTE_JITTER", "30"))  # segundos, espalha as chamadas
+PRECOMPUTE_CLOSE_DELAY = float(os.getenv("PRECOMPUTE_CLOSE_DELAY", "3"))  # espera a Binance fechar o candle
+PRECOMPUTE_WINDOW_H = int(os.getenv("PRECOMPUTE_WINDOW_H", "24"))  # janela do ranking de pedidos
+PRECOMPUTE_ON_START = os.getenv("PRECOMPUTE_ON_START", "1") == "1"
+
+# Pares fixos para completar o ranking (ex.: sem tráfego ainda): "BTCUSDT:4h,ETHUSDT:1h"
+def _parse_pairs(raw: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in raw.split(","):
+        symbol, _, tf = item.strip().partition(":")
+        if symbol:
+            pairs.append((symbol.upper(), TF_TO_BINANCE.get(tf or "4h", "4h")))
+    return pairs
+
+PRECOMPUTE_PAIRS = _parse_pairs(os.getenv("PRECOMPUTE_PAIRS", ""))
+PRECOMPUTE_SPLIT = [25, 50, 25]  # split padrão do /analyze
+
+# =====================================================
+# RANKING DE PEDIDOS
+# =====================================================
+
+def _hits_key(hour: int) -> str:
+    return f"hits:{hour}"
+
+async def record_request(symbol: str, interval: str) -> None:
+    """Contabiliza um /analyze (contadores por hora no cache compartilhado)"""
+    try:
+        hour = int(time.time() // 3600)
+        await get_cache().ahincr(_hits_key(hour), f"{symbol}:{interval}", PRECOMPUTE_WINDOW_H * 3600)
+    except Exception as e:
+        print(f"⚠️  Could not record request: {e}")
+
+async def top_pairs(n: int = PRECOMPUTE_TOP_N) -> List[Tuple[str, str]]:
+    hour = int(time.time() // 3600)
+    counts: Dict[str, int] = defaultdict(int)
+    backend = get_cache()
+    for h in range(hour - PRECOMPUTE_WINDOW_H + 1, hour + 1):
+        for field, value in (await backend.ahgetall(_hits_key(h))).items():
+            counts[field] += value
+    ranked = [tuple(f.split(":", 1)) for f, _ in sorted(counts.items(), key=lambda kv: -kv[1])]
+    pairs: List[Tuple[str, str]] = []
+    for pair in ranked + PRECOMPUTE_PAIRS:
+        if pair not in pairs and pair[1] in INTERVAL_SECONDS:
+            pairs.append(pair)
+    return pairs[:n]
+
+# =====================================================
+# RESULTADOS PRÉ-CALCULADOS
+# =====================================================
+
+def _precomputed_key(symbol: str, interval: str) -> str:
+    return f"precomputed:{symbol}:{interval}"
+
+async def get_precomputed(symbol: str, interval: str) -> Optional[Dict[str, Any]]:
+    try:
+        raw = await get_cache().aget(_precomputed_key(symbol, interval))
+    except Exception:
+        return None
+    return loads(raw) if raw is not None else None
+
+def _until_next_close(interval: str) -> float:
+    step = INTERVAL_SECONDS[interval]
+    return max(1.0, step - time.time() % step)
+
+async def precompute_symbol(symbol: str, intervals: List[str], llm_slots: asyncio.Semaphore) -> int:
+    mtf_candles = await get_multi_tf_candles(symbol, refresh=True)
+    mtf_bases = await cache_mtf_baselines(symbol, mtf_candles)
+    mtf = {
+        iv: {"trend": b.trend, "atr14": b.atr14, "lastClose": b.lastClose, "bars": bars, "source": source}
+        for iv, (b, bars, source) in mtf_bases.items()
+    }
+    done = 0
+    for interval in intervals:
+        candles = mtf_candles[interval][0]
+        base = compute_baseline(candles)
+        technical_context = compute_technical_context(candles)
+        # jitter antes do slot: os pares não chegam ao LLM no mesmo segundo
+        await asyncio.sleep(random.uniform(0, PRECOMPUTE_JITTER))
+        async with llm_slots:
+            sug = await asyncio.to_thread(try_llm_suggestion, base.model_dump(), PRECOMPUTE_SPLIT, technical_context)
+        await get_cache().aset(_precomputed_key(symbol, interval), dumps({
+            "source": source_label(),
+            "baseline": base.model_dump(),
+            "suggestion": sug.model_dump(),
+            "technicalContext": technical_context,
+            "mtf": mtf,
+            "candleTime": candles[-1].time,
+            "computedAt": time.time(),
+        }), _until_next_close(interval))
+        done += 1
+    return done
+
+async def run_cycle(pairs: List[Tuple[str, str]]) -> int:
+    by_symbol: Dict[str, List[str]] = defaultdict(list)
+    for symbol, interval in pairs:
+        by_symbol[symbol].append(interval)
+    llm_slots = asyncio.Semaphore(PRECOMPUTE_CONCURRENCY)
+
+    async def one(symbol: str, intervals: List[str]) -> int:
+        try:
+            return await precompute_symbol(symbol, intervals, llm_slots)
+        except Exception as e:
+            print(f"Precompute error {symbol} {intervals}: {e}", file=sys.stderr, flush=True)
+            return 0
+
+    results = await asyncio.gather(*(one(s, ivs) for s, ivs in by_symbol.items()))
+    return sum(results)
+
+# =====================================================
+# AGENDADOR
+# =====================================================
+
+def shared_cache_ok() -> bool:
+    """Com memory:// o resultado e os contadores ficariam presos neste processo"""
+    if isinstance(get_cache(), MemoryCache):
+        print("❌ Precompute needs a shared CACHE_URL (sqlite:// or redis://); with memory:// "
+              "the API never sees the results or sends request counts. Not starting.",
+              file=sys.stderr, flush=True)
+        return False
+    return True
+
+async def run_forever() -> None:
+    if not shared_cache_ok():
+        return
+    print("Precompute scheduler started.", flush=True)
+    if PRECOMPUTE_ON_START:
+        n = await run_cycle(await top_pairs())
+        print(f"Precomputed on start: {n}", flush=True)
+    while True:
+        now = time.time()
+        next_close = min(now - now % step + step for step in INTERVAL_SECONDS.values())
+        await asyncio.sleep(next_close - now + PRECOMPUTE_CLOSE_DELAY)
+        closed = {iv for iv, step in INTERVAL_SECONDS.items() if int(round(next_close)) % step == 0}
+        pairs = [p for p in await top_pairs() if p[1] in closed]
+        if pairs:
+            t = time.monotonic()
+            n = await run_cycle(pairs)
+            print(f"Precomputed {n}/{len(pairs)} ({sorted(closed)}) in {time.monotonic() - t:.1f}s", flush=True)
+
+def start_in_thread() -> Optional[threading.Thread]:
+    """Roda o agendador num thread com event loop próprio (usado pelo worker.py)"""
+    if not shared_cache_ok():
+        return None
+    t = threading.Thread(target=lambda: asyncio.run(run_forever()), name="precompute", daemon=True)
+    t.start()
+    return t
+
+if __name__ == "__main__":
+    if not shared_cache_ok():
+        sys.exit(1)
+    asyncio.run(run_forever())
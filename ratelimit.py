@@ -0,0 +1,203 @@
+# ratelimit.py
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+
+# =====================================================
+# GOVERNADOR DE PESO DA BINANCE (REQUEST_WEIGHT)
+# =====================================================
+# A Binance limita o peso das requests por IP em janelas de 1 minuto
+# (6000/min no spot). Estourar gera 429 e, se insistir, 418 (ban de IP).
+# Antes de cada chamada reservamos o peso do endpoint; se a janela
+# estiver cheia a chamada espera até a virada (até BINANCE_MAX_WAIT)
+# ou é descartada com BinanceRateLimited. O header X-MBX-USED-WEIGHT-1M
+# corrige o contador local e Retry-After (429/418) bloqueia todos.
+
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", "6000"))
+BINANCE_WEIGHT_HEADROOM = float(os.getenv("BINANCE_WEIGHT_HEADROOM", "0.8"))
+BINANCE_MAX_WAIT = float(os.getenv("BINANCE_MAX_WAIT", "2.0"))  # segundos
+# Arquivo compartilhado entre processos locais (API + worker); vazio = só memória
+BINANCE_WEIGHT_FILE = os.getenv("BINANCE_WEIGHT_FILE", "")
+
+_WINDOW = 60  # segundos
+
+# Peso por endpoint (spot). Variantes sem symbol custam bem mais.
+ENDPOINT_WEIGHTS: Dict[str, int] = {
+    "/api/v3/ping": 1,
+    "/api/v3/klines": 2,
+    "/api/v3/ticker/price": 2,
+    "/api/v3/ticker/24hr": 2,
+    "/api/v3/exchangeInfo": 20,
+}
+_ALL_SYMBOLS_WEIGHTS: Dict[str, int] = {
+    "/api/v3/ticker/price": 4,
+    "/api/v3/ticker/24hr": 80,
+}
+
+
+def endpoint_weight(path: str, params: Optional[Mapping[str, Any]] = None) -> int:
+    if path in _ALL_SYMBOLS_WEIGHTS and not (params or {}).get("symbol"):
+        return _ALL_SYMBOLS_WEIGHTS[path]
+    return ENDPOINT_WEIGHTS.get(path, 1)
+
+
+class BinanceRateLimited(RuntimeError):
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"Binance weight budget exhausted, retry in {self.retry_after}s")
+
+# =====================================================
+# BACKENDS DE ESTADO
+# =====================================================
+# Estado: {"window": início da janela (epoch), "used": peso usado,
+#          "blockedUntil": epoch até quando não chamar (Retry-After)}
+
+def _retry_after(headers: Mapping[str, str]) -> float:
+    """Retry-After da Binance em segundos (sem header: espera a janela inteira)"""
+    raw = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(raw) if raw is not None else _WINDOW
+    except ValueError:
+        return _WINDOW
+
+
+def _empty_state() -> Dict[str, float]:
+    return {"window": 0, "used": 0, "blockedUntil": 0}
+
+
+class MemoryState:
+    """Estado por processo"""
+
+    def __init__(self):
+        self._state = _empty_state()
+        self._lock = threading.Lock()
+
+    def update(self, fn: Callable[[Dict[str, float]], Any]) -> Any:
+        with self._lock:
+            return fn(self._state)
+
+
+class FileState:
+    """Estado num arquivo JSON com flock: processos locais dividem o mesmo orçamento"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def update(self, fn: Callable[[Dict[str, float]], Any]) -> Any:
+        import fcntl
+
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = {**_empty_state(), **json.loads(f.read() or "{}")}
+                except ValueError:
+                    state = _empty_state()
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+# =====================================================
+# GOVERNADOR
+# =====================================================
+
+class WeightGovernor:
+    def __init__(self, backend, limit: int = BINANCE_WEIGHT_LIMIT,
+                 headroom: float = BINANCE_WEIGHT_HEADROOM, max_wait: float = BINANCE_MAX_WAIT):
+        self.backend = backend
+        self.budget = int(limit * headroom)
+        self.max_wait = max_wait
+
+    @staticmethod
+    def _roll(state: Dict[str, float], now: float) -> None:
+        window = now - (now % _WINDOW)
+        if state["window"] != window:
+            state["window"] = window
+            state["used"] = 0
+
+    def _reserve(self, weight: int) -> float:
+        """Reserva o peso e retorna 0, ou retorna quantos segundos esperar"""
+        def fn(state):
+            now = time.time()
+            if state["blockedUntil"] > now:
+                return state["blockedUntil"] - now
+            self._roll(state, now)
+            if state["used"] + weight <= self.budget:
+                state["used"] += weight
+                return 0.0
+            return state["window"] + _WINDOW - now
+        return self.backend.update(fn)
+
+    def _next_wait(self, weight: int, waited: float) -> float:
+        wait = self._reserve(weight)
+        if wait <= 0:
+            return 0.0
+        if waited + wait > self.max_wait:
+            raise BinanceRateLimited(wait)
+        # jitter: quem esperava não volta todo mundo no mesmo instante
+        return wait + random.uniform(0, 0.05)
+
+    def acquire(self, weight: int) -> None:
+        waited = 0.0
+        while True:
+            wait = self._next_wait(weight, waited)
+            if not wait:
+                return
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, weight: int) -> None:
+        waited = 0.0
+        while True:
+            wait = self._next_wait(weight, waited)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """Sincroniza com o peso informado pela Binance e respeita Retry-After"""
+        used = headers.get("x-mbx-used-weight-1m") or headers.get("X-MBX-USED-WEIGHT-1M")
+
+        def fn(state):
+            now = time.time()
+            self._roll(state, now)
+            if used is not None:
+                try:
+                    state["used"] = max(state["used"], int(used))
+                except ValueError:
+                    pass
+            if status_code in (418, 429):
+                state["blockedUntil"] = max(state["blockedUntil"], now + _retry_after(headers))
+        self.backend.update(fn)
+
+    def check(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """observe + BinanceRateLimited em 418/429 (em vez do HTTPStatusError do raise_for_status)"""
+        self.observe(status_code, headers)
+        if status_code in (418, 429):
+            raise BinanceRateLimited(_retry_after(headers))
+
+    def snapshot(self) -> Dict[str, float]:
+        def fn(state):
+            now = time.time()
+            self._roll(state, now)
+            return {
+                "used": state["used"],
+                "budget": self.budget,
+                "blockedFor": round(max(0.0, state["blockedUntil"] - now), 2),
+            }
+        return self.backend.update(fn)
+
+
+governor = WeightGovernor(FileState(BINANCE_WEIGHT_FILE) if BINANCE_WEIGHT_FILE else MemoryState())
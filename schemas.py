@@ -25,6 +25,45 @@ class BaselineOut(BaseModel):
     slopePct: float
     trend: str  # "up", "down", "flat"
 
+# =====================================================
+# MULTI-TIMEFRAME BASELINE
+# =====================================================
+
+class TimeframeBaseline(BaseModel):
+    trend: str  # "up", "down", "flat"
+    atr14: float
+    lastClose: float
+    bars: int
+    source: str  # "resampled", "binance", "live", "request"
+
+# =====================================================
+# SCREENER (todos os pares, sem LLM)
+# =====================================================
+
+class ScreenerItem(BaseModel):
+    symbol: str
+    trend: str  # "up", "down", "flat"
+    lastClose: float
+    atr14: float
+    rsi14: float
+    confluences: int  # sinais a favor do plano (bearish em downtrend, bullish nos demais)
+    quality: str  # "excelente", "boa", "razoável", "ruim"
+    atrFloor: bool  # ATR < 1: o piso do build_rules_fallback domina, sem níveis/RR (vai para o fim)
+    levels: Optional[Dict[str, float]] = None  # E1..E3, stop, TP1..TP3 (build_rules_fallback)
+    RR1: Optional[float] = None
+    RR2: Optional[float] = None
+    RR3: Optional[float] = None
+
+class ScreenerOut(BaseModel):
+    ok: bool
+    tf: str
+    universe: int
+    screened: int
+    skipped: List[str]
+    loadMs: float
+    computeMs: float
+    results: List[ScreenerItem]
+
 # =====================================================
 # SUGGESTION (Resposta da IA)
 # =====================================================
@@ -71,4 +110,5 @@ class AnalyzeOut(BaseModel):
     ok: bool
     source: str  # "gpt-4o-mini", "claude-sonnet-4", "rules-fallback"
     baseline: BaselineOut
-    suggestion: Suggestion
\ No newline at end of file
+    suggestion: Suggestion
+    mtf: Optional[Dict[str, TimeframeBaseline]] = None  # por intervalo: "1h", "4h", "1d"
\ No newline at end of file
@@ -0,0 +1,255 @@
+# screener.py
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import get_or_set
+from ratelimit import BinanceRateLimited
+from schemas import BaselineOut
+from services import build_rules_fallback, fetch_usdt_universe, get_klines_rows, rr_from
+from startup import lazy_import
+from technical import quality_from
+
+# =====================================================
+# SCREENER DE MERCADO (sem LLM)
+# =====================================================
+# Carrega os candles de todo o universo (SCREENER_SYMBOLS ou os pares
+# USDT de maior volume) e roda baseline, indicadores do technical
+# context numa passada vetorizada (numpy, matriz símbolos x candles)
+# em vez de símbolo a símbolo; as fórmulas espelham
+# services.compute_baseline e technical.compute_technical_context.
+# O plano (build_rules_fallback / rr_from) sai das funções escalares.
+
+SCREENER_SYMBOLS = [s.strip().upper() for s in os.getenv("SCREENER_SYMBOLS", "").split(",") if s.strip()]
+SCREENER_MAX_SYMBOLS = int(os.getenv("SCREENER_MAX_SYMBOLS", "400"))
+SCREENER_LIMIT = int(os.getenv("SCREENER_LIMIT", "250"))  # candles por símbolo (EMA 200 + folga)
+SCREENER_KLINES_TTL = float(os.getenv("SCREENER_KLINES_TTL", "60"))
+SCREENER_UNIVERSE_TTL = float(os.getenv("SCREENER_UNIVERSE_TTL", "3600"))
+SCREENER_CONCURRENCY = int(os.getenv("SCREENER_CONCURRENCY", "20"))  # downloads simultâneos
+SCREENER_SPLIT = [25, 50, 25]
+SCREENER_MIN_BARS = 50
+
+_TREND_RANK = {"up": 2, "flat": 1, "down": 0}
+
+# =====================================================
+# CARGA
+# =====================================================
+
+async def load_universe() -> List[str]:
+    if SCREENER_SYMBOLS:
+        return SCREENER_SYMBOLS
+
+    async def load():
+        return await fetch_usdt_universe(SCREENER_MAX_SYMBOLS)
+    return await get_or_set("screener:universe", SCREENER_UNIVERSE_TTL, load)
+
+async def load_rows(symbols: List[str], interval: str) -> Tuple[Dict[str, List[list]], List[str]]:
+    slots = asyncio.Semaphore(SCREENER_CONCURRENCY)
+    skipped: List[str] = []
+    limited: List[BinanceRateLimited] = []
+
+    async def one(symbol: str) -> Optional[List[list]]:
+        async with slots:
+            if limited:  # já bloqueado: não gasta mais peso com o resto da fila
+                return None
+            try:
+                return await get_klines_rows(symbol, interval, SCREENER_LIMIT, ttl=SCREENER_KLINES_TTL)
+            except BinanceRateLimited as e:
+                limited.append(e)
+                return None
+            except Exception:
+                skipped.append(symbol)
+                return None
+
+    results = await asyncio.gather(*(one(s) for s in symbols))
+    if limited:
+        # 418/429 ou governador sem folga: o /screener responde 503 com Retry-After
+        raise limited[0]
+    rows = {s: r for s, r in zip(symbols, results) if r and len(r) >= SCREENER_MIN_BARS}
+    skipped += [s for s, r in zip(symbols, results) if r is not None and len(r) < SCREENER_MIN_BARS]
+    return rows, skipped
+
+# =====================================================
+# PASSADA VETORIZADA
+# =====================================================
+# Matriz (S, T) alinhada à direita. Séries mais curtas são preenchidas
+# à esquerda com o primeiro candle; `start` marca o primeiro candle real
+# de cada linha e as recursões (EMA, RSI) só começam nele.
+
+def _matrix(rows_by_symbol: Dict[str, List[list]]):
+    np = lazy_import("numpy")
+    S = len(rows_by_symbol)
+    T = max(len(r) for r in rows_by_symbol.values())
+    data = np.empty((S, T, 6))
+    start = np.empty(S, dtype=np.int64)
+    for k, rows in enumerate(rows_by_symbol.values()):
+        arr = np.asarray(rows, dtype=float)
+        n = len(arr)
+        data[k, T - n:] = arr
+        data[k, :T - n] = arr[0]
+        start[k] = T - n
+    return data[:, :, 1], data[:, :, 2], data[:, :, 3], data[:, :, 4], data[:, :, 5], start
+
+def _ema(x, spans, start):
+    """services.ema por linha para vários spans de uma vez: x (K, S, T) ou (S, T)
+    com um span por série; antes do `start` fica o próprio valor"""
+    np = lazy_import("numpy")
+    x = np.broadcast_to(x, (len(spans),) + x.shape[-2:])
+    alpha = (2 / (np.asarray(spans, dtype=float) + 1))[:, None]
+    alpha = np.where(np.asarray(spans)[:, None] <= 1, 1.0, alpha)
+    out = np.empty(x.shape)
+    s = x[:, :, 0].copy()
+    out[:, :, 0] = s
+    for t in range(1, x.shape[2]):
+        s = np.where(t <= start, x[:, :, t], alpha * x[:, :, t] + (1 - alpha) * s)
+        out[:, :, t] = s
+    return out
+
+def _rsi(c, start, period: int = 14):
+    """technical.rsi por linha (Wilder)"""
+    np = lazy_import("numpy")
+    S, T = c.shape
+    d = np.diff(c, axis=1)
+    gain, loss = np.maximum(d, 0.0), np.maximum(-d, 0.0)
+    avg_gain = np.zeros(S)
+    avg_loss = np.zeros(S)
+    for t in range(1, T):
+        rel = t - start  # diff t-1 -> t, relativo ao primeiro candle real
+        g, l = gain[:, t - 1], loss[:, t - 1]
+        warm = (rel >= 1) & (rel <= period)
+        avg_gain = np.where(warm, avg_gain + g / period, avg_gain)
+        avg_loss = np.where(warm, avg_loss + l / period, avg_loss)
+        smooth = rel > period
+        avg_gain = np.where(smooth, (avg_gain * (period - 1) + g) / period, avg_gain)
+        avg_loss = np.where(smooth, (avg_loss * (period - 1) + l) / period, avg_loss)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+    rsi = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), rsi)
+    return np.where(T - start <= period, 50.0, rsi)
+
+def _masked_mean(x, mask):
+    np = lazy_import("numpy")
+    count = mask.sum(axis=1)
+    return np.where(count > 0, (x * mask).sum(axis=1) / np.maximum(count, 1), 0.0), count
+
+def analyze_matrix(rows_by_symbol: Dict[str, List[list]], split: List[float] = SCREENER_SPLIT) -> Dict[str, Any]:
+    np = lazy_import("numpy")
+    o, h, l, c, v, start = _matrix(rows_by_symbol)
+    S, T = c.shape
+    n = T - start
+    real = np.arange(T)[None, :] >= start[:, None]
+    last = c[:, -1]
+
+    # ---------------- baseline (compute_baseline) ----------------
+    prev_close = np.concatenate([c[:, :1], c[:, :-1]], axis=1)
+    prev_close = np.where(np.arange(T)[None, :] <= start[:, None], c, prev_close)
+    tr = np.maximum.reduce([h - l, np.abs(h - prev_close), np.abs(prev_close - l)])
+    e9, e12, e21, e26, e50, e200, tr14 = _ema(np.stack([c] * 6 + [tr]), [9, 12, 21, 26, 50, 200, 14], start)
+    atr = np.where(n >= 2, tr14[:, -1], 0.0)
+    ema50 = np.where(n >= 50, e50[:, -1], last)
+    ema200 = np.where(n >= 200, e200[:, -1], last)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where((n > 6) & (last != 0), (e200[:, -1] - e200[:, -6]) / last, 0.0)
+        flat = (np.abs(ema50 - ema200) / np.where(last != 0, last, 1) < 0.002) & (np.abs(slope) < 0.0005)
+    trend = np.where(flat, "flat", np.where((ema50 >= ema200) & (slope >= 0), "up", "down"))
+
+    # ---------------- plano por regras (build_rules_fallback + rr_from) ----------------
+    # Linha a linha com as próprias funções escalares: np.round arredonda os
+    # meios de forma diferente do round() do Python e os níveis precisam bater
+    # com os do /analyze (são só S x 10 valores, o custo está nas séries acima)
+    bases, levels, rrs = [], [], []
+    for k in range(S):
+        base = BaselineOut(
+            lastClose=round(float(last[k]), 2),
+            ema50=round(float(ema50[k]), 2),
+            ema200=round(float(ema200[k]), 2),
+            atr14=round(float(atr[k]), 2),
+            slopePct=round(float(slope[k]), 5),
+            trend=str(trend[k]),
+        )
+        lv = build_rules_fallback(base)
+        bases.append(base)
+        levels.append(lv)
+        rrs.append(rr_from(lv, split))
+
+    # ---------------- technical context (compute_technical_context) ----------------
+    rsi14 = _rsi(c, start, 14)
+    macd_line = e12 - e26
+    hist = macd_line[:, -1] - _ema(macd_line, [9], start)[0, :, -1]
+    mid, _ = _masked_mean(c[:, -20:], real[:, -20:])
+    var, _ = _masked_mean((c[:, -20:] - mid[:, None]) ** 2, real[:, -20:])
+    std = np.sqrt(var)
+    upper, lower = mid + 2 * std, mid - 2 * std
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_b = np.where(upper > lower, (last - lower) / (upper - lower), 0.5)
+    avg_vol, vol_count = _masked_mean(v[:, -21:-1], real[:, -21:-1])
+    avg_vol = np.where(vol_count > 0, avg_vol, v[:, -1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_ratio = np.where(avg_vol != 0, v[:, -1] / avg_vol, 1.0)
+    green = last >= o[:, -1]
+    above200 = last > e200[:, -1]
+    e9_above = e9[:, -1] > e21[:, -1]
+    spike = vol_ratio > 1.5
+
+    bullish = ((rsi14 < 30).astype(int) + (hist > 0) + above200 + e9_above
+               + (pct_b < 0.2) + (spike & green))
+    bearish = ((rsi14 > 70).astype(int) + (hist <= 0) + ~above200 + ~e9_above
+               + (pct_b > 0.8) + (spike & ~green))
+
+    return {
+        "symbols": list(rows_by_symbol),
+        "baseline": bases, "levels": levels, "rr": rrs, "rsi14": rsi14,
+        "bullish": bullish, "bearish": bearish,
+    }
+
+# =====================================================
+# RANKING
+# =====================================================
+
+def rank(m: Dict[str, Any], trend: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    items = []
+    for k, symbol in enumerate(m["symbols"]):
+        base = m["baseline"][k]
+        t = base.trend
+        if trend and t != trend:
+            continue
+        bull, bear = int(m["bullish"][k]), int(m["bearish"][k])
+        # confluências a favor do plano: o de downtrend é vendido
+        pro, con = (bear, bull) if t == "down" else (bull, bear)
+        # ATR < 1 (a maioria dos pares abaixo de $1): o piso max(atr, 1.0) do
+        # build_rules_fallback domina e os níveis/RR não dizem nada do par
+        floored = base.atr14 < 1.0
+        items.append({
+            "symbol": symbol,
+            "trend": t,
+            "lastClose": base.lastClose,
+            "atr14": base.atr14,
+            "rsi14": round(float(m["rsi14"][k]), 2),
+            "confluences": pro,
+            "quality": quality_from(pro, con),
+            "atrFloor": floored,
+            "levels": None if floored else m["levels"][k],
+            "RR1": None if floored else m["rr"][k][0],
+            "RR2": None if floored else m["rr"][k][1],
+            "RR3": None if floored else m["rr"][k][2],
+        })
+    items.sort(key=lambda i: (not i["atrFloor"], _TREND_RANK.get(i["trend"], 0), i["confluences"], i["RR2"] or 0.0),
+               reverse=True)
+    return items[:limit]
+
+async def run_screener(interval: str, trend: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    t = time.perf_counter()
+    symbols = await load_universe()
+    rows, skipped = await load_rows(symbols, interval)
+    load_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    results = rank(analyze_matrix(rows), trend, limit) if rows else []
+    return {
+        "universe": len(symbols),
+        "screened": len(rows),
+        "skipped": skipped,
+        "loadMs": round(load_ms, 1),
+        "computeMs": round((time.perf_counter() - t) * 1000, 1),
+        "results": results,
+    }
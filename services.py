@@ -1,10 +1,32 @@
+import asyncio
 import math
 import os
-from typing import List, Tuple, Dict
+import threading
+from typing import List, Tuple, Dict, Optional
 import httpx
 from schemas import Candle, BaselineOut, Suggestion
+from ratelimit import governor, endpoint_weight
+from cache import get_cache, get_or_set, dumps, loads
+from live import aggregator as live
 
 BINANCE_BASE = os.getenv("BINANCE_BASE", "https://api.binance.com")
+KLINES_CACHE_TTL = float(os.getenv("KLINES_CACHE_TTL", "30"))  # segundos
+
+# Cliente HTTP compartilhado: reaproveita conexões/TLS entre requests.
+# Um por thread: o worker roda precompute/live em threads com event loop próprio.
+_http = threading.local()
+
+def get_http_client() -> httpx.AsyncClient:
+    client = getattr(_http, "client", None)
+    if client is None or client.is_closed:
+        client = _http.client = httpx.AsyncClient(timeout=10)
+    return client
+
+async def close_http_client() -> None:
+    client = getattr(_http, "client", None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+    _http.client = None
 
 def ema(series: List[float], span: int) -> List[float]:
     if not series or span <= 1:
@@ -105,24 +127,242 @@ def rr_from(levels: Dict[str, float], split: List[float]) -> Tuple[float, float,
     def rr(tp): return round(abs(tp - avg) / risk, 2) if risk > 0 else 0.0
     return rr(levels["TP1"]), rr(levels["TP2"]), rr(levels["TP3"])
 
+BINANCE_KLINES_PAGE = 1000  # máximo de candles por request
+
 async def fetch_binance_klines(symbol: str, interval: str, limit: int = 400) -> List[Candle]:
-    url = f"{BINANCE_BASE}/api/v3/klines?symbol={symbol}&interval={interval}&limit={limit}"
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(url)
+    """Últimos `limit` candles; acima de 1000 pagina para trás com endTime"""
+    out: List[Candle] = []
+    end_time: Optional[int] = None
+    while len(out) < limit:
+        page = min(limit - len(out), BINANCE_KLINES_PAGE)
+        url = f"{BINANCE_BASE}/api/v3/klines?symbol={symbol}&interval={interval}&limit={page}"
+        if end_time is not None:
+            url += f"&endTime={end_time}"
+        await governor.acquire_async(endpoint_weight("/api/v3/klines"))
+        r = await get_http_client().get(url)
+        governor.check(r.status_code, r.headers)
         r.raise_for_status()
         data = r.json()
-    out = []
-    for k in data:
-        out.append(Candle(
-            time=int(k[0] // 1000),
-            open=float(k[1]),
-            high=float(k[2]),
-            low=float(k[3]),
-            close=float(k[4]),
-            volume=float(k[5]),
-        ))
+        out = [
+            Candle(
+                time=int(k[0] // 1000),
+                open=float(k[1]),
+                high=float(k[2]),
+                low=float(k[3]),
+                close=float(k[4]),
+                volume=float(k[5]),
+            )
+            for k in data
+        ] + out
+        if len(data) < page:
+            break  # início do histórico do par
+        end_time = int(data[0][0]) - 1
     return out
 
+# No cache compartilhado os candles vão como linhas [t, o, h, l, c, v]
+def candles_to_rows(candles: List[Candle]) -> List[list]:
+    return [[c.time, c.open, c.high, c.low, c.close, c.volume] for c in candles]
+
+def rows_to_candles(rows: List[list]) -> List[Candle]:
+    return [Candle(time=r[0], open=r[1], high=r[2], low=r[3], close=r[4], volume=r[5]) for r in rows]
+
+def _live_candles(symbol: str, interval: str, limit: int) -> Optional[List[Candle]]:
+    candles = live.get_candles(symbol, interval, limit)
+    if candles is not None and len(candles) >= min(limit, MTF_MIN_BARS):
+        return candles
+    return None
+
+def _klines_key(symbol: str, interval: str, limit: int) -> str:
+    return f"klines:{symbol}:{interval}:{limit}"
+
+async def get_klines_rows(symbol: str, interval: str, limit: int = 400, refresh: bool = False,
+                          ttl: float = KLINES_CACHE_TTL) -> List[list]:
+    """Klines como linhas [t, o, h, l, c, v], sem montar Candle (usado em lote pelo screener)"""
+    if not refresh:
+        candles = _live_candles(symbol, interval, limit)
+        if candles is not None:
+            return candles_to_rows(candles)
+    async def load():
+        return candles_to_rows(await fetch_binance_klines(symbol, interval, limit))
+    return await get_or_set(_klines_key(symbol, interval, limit), ttl, load, refresh=refresh)
+
+async def get_klines_cached(symbol: str, interval: str, limit: int = 400, refresh: bool = False) -> List[Candle]:
+    """Agregador ao vivo (live.py) quando disponível; senão REST via cache compartilhado"""
+    if not refresh:
+        candles = _live_candles(symbol, interval, limit)
+        if candles is not None:
+            return candles
+    return rows_to_candles(await get_klines_rows(symbol, interval, limit, refresh))
+
+async def fetch_usdt_universe(max_symbols: int) -> List[str]:
+    """Pares USDT negociáveis, do maior para o menor volume em 24h (2 chamadas em lote)"""
+    client = get_http_client()
+    await governor.acquire_async(endpoint_weight("/api/v3/exchangeInfo"))
+    r = await client.get(f"{BINANCE_BASE}/api/v3/exchangeInfo")
+    governor.check(r.status_code, r.headers)
+    r.raise_for_status()
+    trading = {
+        s["symbol"] for s in r.json()["symbols"]
+        if s.get("status") == "TRADING" and s.get("quoteAsset") == "USDT" and s.get("isSpotTradingAllowed", True)
+    }
+    await governor.acquire_async(endpoint_weight("/api/v3/ticker/24hr"))
+    r = await client.get(f"{BINANCE_BASE}/api/v3/ticker/24hr")
+    governor.check(r.status_code, r.headers)
+    r.raise_for_status()
+    tickers = [t for t in r.json() if t["symbol"] in trading]
+    tickers.sort(key=lambda t: -float(t.get("quoteVolume") or 0))
+    return [t["symbol"] for t in tickers[:max_symbols]]
+
+async def ping_binance() -> int:
+    await governor.acquire_async(endpoint_weight("/api/v3/ping"))
+    r = await get_http_client().get(f"{BINANCE_BASE}/api/v3/ping")
+    governor.check(r.status_code, r.headers)
+    r.raise_for_status()
+    return r.status_code
+
 TF_TO_BINANCE = {"1h": "1h", "4h": "4h", "D": "1d", "1d": "1d"}
 
+# =====================================================
+# MULTI-TIMEFRAME: 4h/1d reamostrados a partir do 1h
+# =====================================================
+
+INTERVAL_SECONDS = {"1h": 3600, "4h": 14400, "1d": 86400}
+MTF_INTERVALS = ["1h", "4h", "1d"]
+MTF_SOURCE_INTERVAL = "1h"
+MTF_MIN_BARS = int(os.getenv("MTF_MIN_BARS", "50"))
+# Barras por timeframe para o baseline (o /analyze sempre usou 400 candles
+# nativos; com menos, a EMA 200 parte de uma semente recente e muda a tendência)
+MTF_BASELINE_BARS = int(os.getenv("MTF_BASELINE_BARS", "400"))
+# 1h suficiente para MTF_BASELINE_BARS barras de 4h (+1 bucket de alinhamento);
+# acima de 1000 o fetch é paginado (2 requests no padrão)
+MTF_SOURCE_LIMIT = int(os.getenv("MTF_SOURCE_LIMIT", str(MTF_BASELINE_BARS * 4 + 4)))
+
+def resample_candles(candles: List[Candle], interval: str, source_interval: str = MTF_SOURCE_INTERVAL) -> List[Candle]:
+    """
+    Agrega candles em barras maiores alinhadas em UTC (como a Binance:
+    4h às 00/04/08... e 1d às 00:00). O primeiro bucket é descartado se
+    a fonte começa no meio dele (open errado); o último é mantido mesmo
+    parcial, pois é o candle em formação (igual ao último kline da Binance).
+    """
+    step = INTERVAL_SECONDS[interval]
+    if step == INTERVAL_SECONDS[source_interval]:
+        return candles[:]
+    first = next((i for i, c in enumerate(candles) if c.time % step == 0), len(candles))
+    out: List[Candle] = []
+    bucket: Optional[Dict[str, float]] = None
+    for c in candles[first:]:
+        start = c.time - c.time % step
+        if bucket is not None and bucket["time"] == start:
+            bucket["high"] = max(bucket["high"], c.high)
+            bucket["low"] = min(bucket["low"], c.low)
+            bucket["close"] = c.close
+            bucket["volume"] += c.volume
+            continue
+        if bucket is not None:
+            out.append(Candle(**bucket))
+        bucket = {"time": start, "open": c.open, "high": c.high,
+                  "low": c.low, "close": c.close, "volume": c.volume}
+    if bucket is not None:
+        out.append(Candle(**bucket))
+    return out
+
+def _source_covers(interval: str) -> bool:
+    """A fonte (MTF_SOURCE_LIMIT candles de 1h) rende MTF_BASELINE_BARS barras deste TF?"""
+    bars = MTF_SOURCE_LIMIT * INTERVAL_SECONDS[MTF_SOURCE_INTERVAL] // INTERVAL_SECONDS[interval] - 1
+    return bars >= MTF_BASELINE_BARS
+
+async def _peek_source(symbol: str) -> Optional[List[Candle]]:
+    """Fonte 1h já disponível sem rede: ao vivo ou no cache"""
+    candles = _live_candles(symbol, MTF_SOURCE_INTERVAL, MTF_SOURCE_LIMIT)
+    if candles is not None:
+        return candles
+    raw = await get_cache().aget(_klines_key(symbol, MTF_SOURCE_INTERVAL, MTF_SOURCE_LIMIT))
+    return rows_to_candles(loads(raw)) if raw is not None else None
+
+async def get_multi_tf_candles(symbol: str, intervals: List[str] = MTF_INTERVALS, refresh: bool = False) -> Dict[str, Tuple[List[Candle], str]]:
+    """
+    Candles de cada timeframe pedido. Reamostra do 1h quando a fonte
+    (MTF_SOURCE_LIMIT candles de 1h) já está ao vivo/no cache, ou quando
+    dois ou mais TFs pedidos saem dela (um download serve a todos). Os
+    demais (1d, ou um TF pedido sozinho) vêm direto da Binance com
+    MTF_BASELINE_BARS candles, em paralelo com a fonte.
+    Retorna {interval: (candles, "resampled" | "binance")}.
+    """
+    source = None if refresh else await _peek_source(symbol)
+    if source is not None:
+        fetch_source = False
+        native = [iv for iv in intervals
+                  if iv != MTF_SOURCE_INTERVAL and len(resample_candles(source, iv)) < MTF_BASELINE_BARS]
+    else:
+        covered = [iv for iv in intervals if _source_covers(iv)]
+        fetch_source = len(covered) >= 2
+        native = [iv for iv in intervals if not (fetch_source and iv in covered)]
+
+    fetches = [get_klines_cached(symbol, iv, MTF_BASELINE_BARS, refresh) for iv in native]
+    if fetch_source:
+        fetches.append(get_klines_cached(symbol, MTF_SOURCE_INTERVAL, MTF_SOURCE_LIMIT, refresh))
+    results = await asyncio.gather(*fetches, return_exceptions=True)
+    if fetch_source:
+        source = results.pop()
+        if isinstance(source, BaseException):
+            raise source
+    fetched = dict(zip(native, results))
+
+    out: Dict[str, Tuple[List[Candle], str]] = {}
+    for interval in intervals:
+        if interval not in fetched:
+            out[interval] = (source, "binance") if interval == MTF_SOURCE_INTERVAL else \
+                (resample_candles(source, interval), "resampled")
+            continue
+        candles = fetched[interval]
+        if not isinstance(candles, BaseException):
+            out[interval] = (candles, "binance")
+            continue
+        bars = resample_candles(source, interval) if source else []
+        if not bars:
+            raise candles
+        # sem o fetch nativo, melhor a série curta do que derrubar os outros TFs
+        print(f"⚠️  {symbol} {interval} fetch failed ({candles}), using {len(bars)} resampled bars")
+        out[interval] = (bars, "resampled")
+    return out
+
+def _mtf_key(symbol: str, interval: str) -> str:
+    return f"mtf:{symbol}:{interval}"
+
+async def peek_mtf_baselines(symbol: str) -> Dict[str, Tuple[BaselineOut, int, str]]:
+    """Baselines que saem sem rede: candles ao vivo ou baseline no cache"""
+    out: Dict[str, Tuple[BaselineOut, int, str]] = {}
+    backend = get_cache()
+    for interval in MTF_INTERVALS:
+        candles = _live_candles(symbol, interval, MTF_BASELINE_BARS)
+        if candles is not None:
+            out[interval] = (compute_baseline(candles), len(candles), "live")
+            continue
+        raw = await backend.aget(_mtf_key(symbol, interval))
+        if raw is not None:
+            b, bars, source = loads(raw)
+            out[interval] = (BaselineOut(**b), bars, source)
+    return out
+
+async def cache_mtf_baselines(symbol: str, mtf: Dict[str, Tuple[List[Candle], str]]) -> Dict[str, Tuple[BaselineOut, int, str]]:
+    """Calcula e guarda (por TF) o baseline dos candles de get_multi_tf_candles"""
+    out: Dict[str, Tuple[BaselineOut, int, str]] = {}
+    backend = get_cache()
+    for interval, (candles, source) in mtf.items():
+        if not candles:
+            continue
+        base = compute_baseline(candles)
+        out[interval] = (base, len(candles), source)
+        await backend.aset(_mtf_key(symbol, interval), dumps([base.model_dump(), len(candles), source]), KLINES_CACHE_TTL)
+    return out
 
+async def get_mtf_baselines(symbol: str, intervals: List[str] = MTF_INTERVALS, refresh: bool = False) -> Dict[str, Tuple[BaselineOut, int, str]]:
+    """
+    Baseline por timeframe. Só os `intervals` pedidos vão à rede; os
+    demais TFs entram se já estiverem ao vivo ou no cache.
+    """
+    out = {} if refresh else await peek_mtf_baselines(symbol)
+    missing = [iv for iv in intervals if iv not in out]
+    if missing:
+        out.update(await cache_mtf_baselines(symbol, await get_multi_tf_candles(symbol, missing, refresh)))
+    return {iv: out[iv] for iv in MTF_INTERVALS if iv in out}
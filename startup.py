@@ -0,0 +1,199 @@
+# startup.py
+import asyncio
+import importlib
+import importlib.abc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# =====================================================
+# PERFIL DE COLD START
+# =====================================================
+# Mede o tempo de import por pacote, o warm-up opcional e o tempo até
+# a primeira resposta saudável em GET /. O tempo de cada módulo é o
+# próprio (sem os imports aninhados, como `python -X importtime`) e
+# vai para o pacote de topo que de fato carregou: o httpx puxado por
+# services conta como httpx, não como services. Os blocos timed_import
+# de main.py/lazy_import registram o tempo de parede e o que carregaram.
+
+_T0 = time.perf_counter()
+_IMPORT_TIMES: Dict[str, float] = {}  # pacote de topo -> ms (tempo próprio)
+_IMPORT_BLOCKS: Dict[str, Dict[str, Any]] = {}  # bloco -> {"ms", "loaded"}
+_first_healthy_ms: Optional[float] = None
+
+WARMUP_MODE = os.getenv("WARMUP_MODE", "off")  # "off" | "background" | "blocking"
+WARMUP_SYMBOLS = [s.strip().upper() for s in os.getenv("WARMUP_SYMBOLS", "").split(",") if s.strip()]
+# As entradas aquecidas vivem KLINES_CACHE_TTL (30 s): até o primeiro /analyze
+# (no máximo WARMUP_KEEP_S segundos) elas são recarregadas antes de expirar
+WARMUP_KEEP_S = float(os.getenv("WARMUP_KEEP_S", "900"))
+_WARMUP: Dict[str, Any] = {"mode": WARMUP_MODE, "status": "idle", "steps": {}, "refreshes": 0}
+_first_request_ms: Optional[float] = None
+
+
+def _process_age_ms() -> Optional[float]:
+    """Idade do processo (desde o exec), usando /proc quando disponível"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])  # campo 22 (starttime), contando após o ")"
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000
+    except Exception:
+        return None
+
+
+_BOOT_OFFSET_MS = (_process_age_ms() or 0.0)
+
+
+def _since_start_ms() -> float:
+    return _BOOT_OFFSET_MS + (time.perf_counter() - _T0) * 1000
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Acha o spec com os outros finders e cronometra o exec_module do loader"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            find = getattr(finder, "find_spec", None)
+            if finder is self or find is None:
+                continue
+            spec = find(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # só loaders por módulo (instâncias); BuiltinImporter/FrozenImporter são classes
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            loader.exec_module = self._timed(name.partition(".")[0], loader.exec_module)
+        return spec
+
+    def _timed(self, top: str, exec_module):
+        def run(module):
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)  # tempo dos imports aninhados
+            t = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - t
+                own = total - stack.pop()
+                if stack:
+                    stack[-1] += total
+                _IMPORT_TIMES[top] = _IMPORT_TIMES.get(top, 0.0) + own * 1000
+        return run
+
+
+sys.meta_path.insert(0, _ImportTimer())
+
+
+@contextmanager
+def timed_import(name: str):
+    """Registra o tempo de parede do bloco e os pacotes que ele carregou"""
+    before = set(sys.modules)
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        loaded = {m.partition(".")[0] for m in set(sys.modules) - before}
+        _IMPORT_BLOCKS[name] = {"ms": round((time.perf_counter() - t) * 1000, 2), "loaded": sorted(loaded)}
+
+
+def lazy_import(name: str):
+    """Importa um módulo no primeiro uso, registrando o tempo de import"""
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    with timed_import(name):
+        mod = importlib.import_module(name)
+    return mod
+
+
+def mark_healthy() -> None:
+    global _first_healthy_ms
+    if _first_healthy_ms is None:
+        _first_healthy_ms = round(_since_start_ms(), 2)
+
+
+def mark_request() -> None:
+    """Primeiro /analyze: o warm-up já cumpriu o papel e para de recarregar"""
+    global _first_request_ms
+    if _first_request_ms is None:
+        _first_request_ms = round(_since_start_ms(), 2)
+
+
+def report() -> Dict[str, Any]:
+    return {
+        "imports": {k: round(v, 2) for k, v in sorted(_IMPORT_TIMES.items(), key=lambda kv: -kv[1])},
+        "importTotalMs": round(sum(_IMPORT_TIMES.values()), 2),
+        "importBlocks": _IMPORT_BLOCKS,
+        "firstHealthyMs": _first_healthy_ms,
+        "firstRequestMs": _first_request_ms,
+        "uptimeMs": round(_since_start_ms(), 2),
+        "warmup": _WARMUP,
+    }
+
+# =====================================================
+# WARM-UP (opcional, executado no lifespan do app)
+# =====================================================
+
+async def _step(name: str, coro) -> None:
+    t = time.perf_counter()
+    try:
+        detail = await coro
+        _WARMUP["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - t) * 1000, 2), "detail": detail}
+    except Exception as e:
+        _WARMUP["steps"][name] = {"ok": False, "ms": round((time.perf_counter() - t) * 1000, 2), "error": str(e)}
+
+
+async def warmup(symbols: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Pré-abre as conexões com Binance e com o provedor de LLM e
+    preenche o cache de klines/baselines MTF que o /analyze lê
+    """
+    from services import get_mtf_baselines, ping_binance
+    import llm
+
+    symbols = WARMUP_SYMBOLS if symbols is None else symbols
+
+    _WARMUP["status"] = "running"
+    t = time.perf_counter()
+
+    async def prime(symbol: str):
+        bases = await get_mtf_baselines(symbol)
+        return {interval: bars for interval, (_, bars, _) in bases.items()}
+
+    steps = [_step("binance", ping_binance()), _step("llm", asyncio.to_thread(llm.warmup))]
+    for symbol in symbols:
+        steps.append(_step(f"mtf:{symbol}", prime(symbol)))
+    await asyncio.gather(*steps)
+
+    _WARMUP["status"] = "done"
+    _WARMUP["ms"] = round((time.perf_counter() - t) * 1000, 2)
+    return _WARMUP
+
+
+async def keep_warm(symbols: Optional[List[str]] = None) -> None:
+    """Recarrega as entradas do warm-up antes de expirarem, até o primeiro /analyze"""
+    from services import KLINES_CACHE_TTL, get_mtf_baselines
+
+    symbols = WARMUP_SYMBOLS if symbols is None else symbols
+    every = max(1.0, KLINES_CACHE_TTL * 0.8)
+    deadline = time.monotonic() + WARMUP_KEEP_S
+    while symbols and time.monotonic() + every < deadline:
+        await asyncio.sleep(every)
+        if _first_request_ms is not None:
+            break
+        results = await asyncio.gather(*(get_mtf_baselines(s, refresh=True) for s in symbols), return_exceptions=True)
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"⚠️  Keep-warm {symbol} failed: {result}")
+        _WARMUP["refreshes"] += 1
+
@@ -0,0 +1,142 @@
+# technical.py
+from typing import Any, Dict, List
+from schemas import Candle
+from services import ema, atr14
+
+# =====================================================
+# TECHNICAL CONTEXT NO BACKEND
+# =====================================================
+# Mesmo formato do technicalContext enviado pelo frontend (ver
+# build_enhanced_prompt), calculado a partir dos candles. Usado pelo
+# pré-cálculo de candle close, onde não há frontend na jogada.
+
+def rsi(closes: List[float], period: int = 14) -> float:
+    """RSI com suavização de Wilder (último valor)"""
+    if len(closes) <= period:
+        return 50.0
+    gains = losses = 0.0
+    for prev, cur in zip(closes[:period], closes[1:period + 1]):
+        d = cur - prev
+        gains += max(d, 0.0)
+        losses += max(-d, 0.0)
+    avg_gain, avg_loss = gains / period, losses / period
+    for prev, cur in zip(closes[period:], closes[period + 1:]):
+        d = cur - prev
+        avg_gain = (avg_gain * (period - 1) + max(d, 0.0)) / period
+        avg_loss = (avg_loss * (period - 1) + max(-d, 0.0)) / period
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+def macd(closes: List[float]) -> Dict[str, float]:
+    line = [a - b for a, b in zip(ema(closes, 12), ema(closes, 26))]
+    signal = ema(line, 9)
+    return {"macd": line[-1], "signal": signal[-1], "histogram": line[-1] - signal[-1]}
+
+def bollinger(closes: List[float], period: int = 20, k: float = 2.0) -> Dict[str, float]:
+    window = closes[-period:]
+    mid = sum(window) / len(window)
+    std = (sum((x - mid) ** 2 for x in window) / len(window)) ** 0.5
+    upper, lower = mid + k * std, mid - k * std
+    percent_b = (closes[-1] - lower) / (upper - lower) if upper > lower else 0.5
+    return {"upper": upper, "middle": mid, "lower": lower, "percentB": percent_b}
+
+def pivot_points(c: Candle) -> Dict[str, float]:
+    """Pivots clássicos a partir do último candle fechado"""
+    p = (c.high + c.low + c.close) / 3
+    rng = c.high - c.low
+    return {
+        "pivot": p,
+        "r1": 2 * p - c.low, "s1": 2 * p - c.high,
+        "r2": p + rng, "s2": p - rng,
+        "r3": c.high + 2 * (p - c.low), "s3": c.low - 2 * (c.high - p),
+    }
+
+def quality_from(bullish: int, bearish: int) -> str:
+    net = bullish - bearish
+    if net >= 4:
+        return "excelente"
+    if net >= 2:
+        return "boa"
+    if net >= 0:
+        return "razoável"
+    return "ruim"
+
+def compute_technical_context(candles: List[Candle]) -> Dict[str, Any]:
+    closes = [c.close for c in candles]
+    last = candles[-1]
+    e9, e21, e50, e200 = (ema(closes, n)[-1] for n in (9, 21, 50, 200))
+    atr = atr14(candles)[-1]
+    m = macd(closes)
+    bb = bollinger(closes)
+    r14, r21 = rsi(closes, 14), rsi(closes, 21)
+    volumes = [c.volume for c in candles[-21:-1]] or [last.volume]
+    avg_vol = sum(volumes) / len(volumes)
+    vol_ratio = last.volume / avg_vol if avg_vol else 1.0
+
+    if e9 > e21 > e50:
+        trend = "up"
+    elif e9 < e21 < e50:
+        trend = "down"
+    else:
+        trend = "flat"
+    # % dos últimos 20 fechamentos do lado da tendência em relação à EMA 50
+    recent = closes[-20:]
+    if trend == "down":
+        strength = 100 * sum(1 for x in recent if x < e50) / len(recent)
+    else:
+        strength = 100 * sum(1 for x in recent if x > e50) / len(recent)
+    atr_pct = atr / last.close if last.close else 0.0
+    volatility = "high" if atr_pct > 0.03 else "medium" if atr_pct > 0.015 else "low"
+
+    bullish: List[str] = []
+    bearish: List[str] = []
+    if r14 < 30:
+        bullish.append(f"RSI sobrevendido ({r14:.1f})")
+    elif r14 > 70:
+        bearish.append(f"RSI sobrecomprado ({r14:.1f})")
+    (bullish if m["histogram"] > 0 else bearish).append(
+        "MACD histograma positivo" if m["histogram"] > 0 else "MACD histograma negativo")
+    (bullish if last.close > e200 else bearish).append(
+        "Preço acima da EMA 200" if last.close > e200 else "Preço abaixo da EMA 200")
+    (bullish if e9 > e21 else bearish).append(
+        "EMA 9 acima da EMA 21" if e9 > e21 else "EMA 9 abaixo da EMA 21")
+    if bb["percentB"] < 0.2:
+        bullish.append("Preço próximo da banda inferior de Bollinger")
+    elif bb["percentB"] > 0.8:
+        bearish.append("Preço próximo da banda superior de Bollinger")
+    if vol_ratio > 1.5:
+        (bullish if last.close >= last.open else bearish).append(
+            f"Volume {vol_ratio:.1f}x acima da média")
+
+    warnings: List[str] = []
+    if volatility == "high":
+        warnings.append("⚠️ Volatilidade alta: use stops mais largos e posição menor")
+    if vol_ratio < 0.5:
+        warnings.append("⚠️ Volume baixo: aguarde confirmação")
+    if r14 > 70:
+        warnings.append("⚠️ RSI sobrecomprado: evite entradas agora")
+    if last.close < e200:
+        warnings.append("⚠️ Preço abaixo da EMA 200: tendência de baixa no timeframe")
+
+    return {
+        "technicalIndicators": {
+            "trend": trend,
+            "trendStrength": strength,
+            "volatility": volatility,
+            "rsi14": r14,
+            "rsi21": r21,
+            "macd": m,
+            "ema9": e9,
+            "ema21": e21,
+            "ema50": e50,
+            "ema200": e200,
+            "bollingerBands": bb,
+            "pivotPoints": pivot_points(candles[-2] if len(candles) > 1 else last),
+            "volumeRatio": vol_ratio,
+        },
+        "signals": {"bullish": bullish, "bearish": bearish},
+        "quality": quality_from(len(bullish), len(bearish)),
+        "confluences": len(bullish),
+        "warnings": warnings,
+    }
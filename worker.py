@@ -1,9 +1,15 @@
 # worker.py
-import time, sys
+import os, time, sys
 from notify import run_scan_once
 
 if __name__ == "__main__":
     print("Worker started.", flush=True)
+    import live
+    if live.enabled():
+        live.start_in_thread()  # preço ao vivo para o avaliador de watches
+    if os.getenv("PRECOMPUTE_IN_WORKER") == "1":
+        from precompute import start_in_thread
+        start_in_thread()
     while True:
         try:
             n = run_scan_once()